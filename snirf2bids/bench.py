@@ -0,0 +1,278 @@
+""" Benchmarks for the SNIRF to BIDS conversion
+
+Generates synthetic SNIRF files and times every stage of their conversion, so that releases can be compared on the
+same workload. Results are written as JSON:
+
+    python -m snirf2bids.bench --channels 256 --events 500 --samples 20000 --output results.json
+
+Maintained by the Boston University Neurophotonics Center
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+import h5py
+import numpy as np
+
+from .snirf2bids import (SnirfSnapshot, Coordsystem, Optodes, Channels, Sidecar, Events, _compliancy_check,
+                         _snirf_blocks, subjects_from_snirf, __version__)
+
+# Workloads of the default suite, from a short recording to a dense, long one
+SUITE = (
+    {'name': 'small', 'channels': 32, 'events': 20, 'stims': 2, 'aux': 1, 'samples': 3000, 'blocks': 1},
+    {'name': 'medium', 'channels': 256, 'events': 500, 'stims': 4, 'aux': 4, 'samples': 20000, 'blocks': 1},
+    {'name': 'large', 'channels': 2048, 'events': 5000, 'stims': 8, 'aux': 8, 'samples': 20000, 'blocks': 2},
+)
+
+_COMPONENTS = (('coordsystem', Coordsystem), ('optodes', Optodes), ('channels', Channels), ('sidecar', Sidecar),
+               ('events', Events))
+
+
+def make_snirf(fpath, channels=32, events=20, stims=2, aux=1, samples=3000, blocks=1, wavelengths=(760., 850.),
+               frequency=10., seed=0):
+    """Writes a synthetic SNIRF file
+
+        The probe has as many sources and detectors as needed to give the requested number of channels (source-detector
+        pairs times wavelengths).
+
+        Args:
+            fpath: The file path to the output SNIRF file
+            channels: The number of channels (measurementList entries) of every data block
+            events: The number of events of every stim condition
+            stims: The number of stim conditions
+            aux: The number of aux channels
+            samples: The number of time points of every data block
+            blocks: The number of /nirs{i} groups (each with a single data block, all with the same probe)
+            wavelengths: The wavelengths of the probe
+            frequency: The sampling frequency in Hz
+            seed: The seed of the random data
+
+        Returns:
+            The file path to the SNIRF file
+    """
+
+    rng = np.random.default_rng(seed)
+    pairs = math.ceil(channels / len(wavelengths))
+    optodes = math.ceil(math.sqrt(pairs))
+    time_points = np.arange(samples) / frequency
+    duration = samples / frequency
+    # every block is recorded with the same probe (the blocks of a session share its optodes files)
+    source_pos = rng.random((optodes, 3)) * 100
+    detector_pos = rng.random((optodes, 3)) * 100
+
+    with h5py.File(fpath, 'w') as f:
+        f.create_dataset('formatVersion', data=b'1.0')
+        for n in range(blocks):
+            nirs = f.create_group('nirs' if blocks == 1 else 'nirs' + str(n + 1))
+            tags = nirs.create_group('metaDataTags')
+            for key, value in (('SubjectID', '01'), ('MeasurementDate', '2022-01-01'),
+                               ('MeasurementTime', '10:00:00.0-05:00'), ('LengthUnit', 'mm'), ('TimeUnit', 's'),
+                               ('FrequencyUnit', 'Hz')):
+                tags.create_dataset(key, data=value.encode())
+
+            probe = nirs.create_group('probe')
+            probe.create_dataset('wavelengths', data=np.array(wavelengths, dtype=float))
+            probe.create_dataset('sourcePos3D', data=source_pos)
+            probe.create_dataset('detectorPos3D', data=detector_pos)
+            probe.create_dataset('sourceLabels', data=np.array(['S' + str(i + 1) for i in range(optodes)], dtype='S'))
+            probe.create_dataset('detectorLabels', data=np.array(['D' + str(i + 1) for i in range(optodes)],
+                                                                 dtype='S'))
+
+            data = nirs.create_group('data1')
+            data.create_dataset('dataTimeSeries', data=rng.random((samples, channels)))
+            data.create_dataset('time', data=time_points)
+            for k in range(channels):
+                pair, wavelength = divmod(k, len(wavelengths))
+                measurement = data.create_group('measurementList' + str(k + 1))
+                measurement.create_dataset('sourceIndex', data=pair // optodes + 1)
+                measurement.create_dataset('detectorIndex', data=pair % optodes + 1)
+                measurement.create_dataset('wavelengthIndex', data=wavelength + 1)
+                measurement.create_dataset('dataType', data=1)
+                measurement.create_dataset('dataTypeIndex', data=1)
+
+            for s in range(stims):
+                stim = nirs.create_group('stim' + str(s + 1))
+                stim.create_dataset('name', data=('condition' + str(s + 1)).encode())
+                stim.create_dataset('data', data=np.column_stack([np.sort(rng.random(events) * duration),
+                                                                  np.full(events, 2.), np.ones(events)]))
+
+            for a in range(aux):
+                group = nirs.create_group('aux' + str(a + 1))
+                group.create_dataset('name', data=('aux' + str(a + 1)).encode())
+                group.create_dataset('dataTimeSeries', data=rng.random(samples))
+                group.create_dataset('time', data=time_points)
+    return fpath
+
+
+def _stages(fpath, outputpath):
+    """Lists the stages of the conversion of a SNIRF file, in pipeline order
+
+        Every stage is a (name, function) pair; a stage may use the result of the previous ones through the shared
+        state dictionary passed to it.
+    """
+
+    def open_file(state):
+        state['snapshot'] = SnirfSnapshot(fpath)
+        state['snapshot'].snirf
+        state['blocks'] = _snirf_blocks(state['snapshot'])
+
+    def load(cls):
+        def stage(state):
+            for block in state['blocks']:
+                cls().load_from_SNIRF(state['snapshot'], block)
+        return stage
+
+    def subjects(state):
+        state['subjects'] = subjects_from_snirf(fpath)
+
+    def export(state):
+        for subj in state['subjects']:
+            subj.export('Folder', outputpath)
+
+    def compliancy_check(state):
+        for subj in state['subjects']:
+            _compliancy_check(subj)
+
+    return ([('open', open_file)] +
+            [(cls.__name__ + '.load_from_SNIRF', load(cls)) for name, cls in _COMPONENTS] +
+            [('subjects_from_snirf', subjects), ('export', export), ('compliancy_check', compliancy_check)])
+
+
+def _run_once(fpath, memory=False):
+    """Runs every stage once
+
+        Args:
+            fpath: The file path to the SNIRF file
+            memory: Trace the Python memory allocations (slower) instead of measuring the wall time
+
+        Returns:
+            A dictionary of the wall time in seconds (or the peak traced memory in bytes) of every stage
+    """
+
+    outputpath = tempfile.mkdtemp(prefix='snirf2bids-bench-')
+    state = {}
+    measured = {}
+    try:
+        for name, stage in _stages(fpath, outputpath):
+            if memory:
+                tracemalloc.start()
+                stage(state)
+                measured[name] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            else:
+                start = time.perf_counter()
+                stage(state)
+                measured[name] = time.perf_counter() - start
+    finally:
+        if 'snapshot' in state:
+            state['snapshot'].close()
+        shutil.rmtree(outputpath, ignore_errors=True)
+    return measured
+
+
+def run(fpath, repeat=5, memory=True):
+    """Benchmarks the conversion of a SNIRF file
+
+        Args:
+            fpath: The file path to the SNIRF file
+            repeat: The number of timed runs of every stage
+            memory: Also measure the peak (Python) memory of every stage, in one extra untimed run
+
+        Returns:
+            A dictionary with the wall times in seconds of every run ('times'), their minimum and median and the peak
+            memory in bytes ('peak_memory', None if not measured) of every stage, keyed by stage name
+    """
+
+    with warnings.catch_warnings():
+        # the synthetic files are not BIDS compliant (no TaskName, ...); that is not what is being measured
+        warnings.simplefilter('ignore')
+        runs = [_run_once(fpath) for i in range(repeat)]
+        peaks = _run_once(fpath, memory=True) if memory else {}
+
+    stages = {}
+    for name in runs[0]:
+        times = [measured[name] for measured in runs]
+        stages[name] = {'times': times, 'min': min(times), 'median': float(np.median(times)),
+                        'peak_memory': peaks.get(name)}
+    return stages
+
+
+def _environment():
+    """Describes the versions the benchmark ran with"""
+    import pysnirf2
+
+    return {'snirf2bids': __version__, 'pysnirf2': getattr(pysnirf2, '__version__', None), 'h5py': h5py.__version__,
+            'numpy': np.__version__, 'python': platform.python_version(), 'platform': platform.platform()}
+
+
+def run_suite(suite=SUITE, repeat=5, memory=True, workdir=None):
+    """Generates the synthetic SNIRF file of every workload and benchmarks its conversion
+
+        Args:
+            suite: A sequence of workloads, dictionaries with a 'name' and make_snirf keyword arguments
+            repeat: The number of timed runs of every stage
+            memory: Also measure the peak memory of every stage
+            workdir: The directory for the generated files (a temporary directory, removed afterwards, by default)
+
+        Returns:
+            A dictionary with the environment ('environment') and, for every workload, its parameters, file size and
+            stage results ('workloads')
+    """
+
+    tmpdir = None
+    if workdir is None:
+        workdir = tmpdir = tempfile.mkdtemp(prefix='snirf2bids-bench-')
+    try:
+        workloads = []
+        for workload in suite:
+            params = {key: value for key, value in workload.items() if key != 'name'}
+            fpath = make_snirf(os.path.join(workdir, 'sub-01_task-bench' + workload['name'] + '_nirs.snirf'),
+                               **params)
+            workloads.append({'name': workload['name'], 'params': params, 'file_size': os.path.getsize(fpath),
+                              'stages': run(fpath, repeat, memory)})
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+    return {'environment': _environment(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'workloads': workloads}
+
+
+def main(argv=None):
+    """Command line entry point (python -m snirf2bids.bench)"""
+    parser = argparse.ArgumentParser(prog='python -m snirf2bids.bench',
+                                     description='Benchmark the conversion of synthetic SNIRF files. Without workload '
+                                                 'options, runs the default small/medium/large suite.')
+    parser.add_argument('--channels', type=int, help='channels (measurementList entries) per data block')
+    parser.add_argument('--events', type=int, help='events per stim condition')
+    parser.add_argument('--stims', type=int, help='stim conditions')
+    parser.add_argument('--aux', type=int, help='aux channels')
+    parser.add_argument('--samples', type=int, help='time points per data block')
+    parser.add_argument('--blocks', type=int, help='/nirs{i} groups')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per stage (default: 5)')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure the peak memory')
+    parser.add_argument('--output', help='JSON results file (default: standard output)')
+    args = parser.parse_args(argv)
+
+    params = {key: getattr(args, key) for key in ('channels', 'events', 'stims', 'aux', 'samples', 'blocks')
+              if getattr(args, key) is not None}
+    suite = SUITE if not params else [dict(SUITE[0], name='custom', **params)]
+    results = run_suite(suite, repeat=args.repeat, memory=not args.no_memory)
+
+    out = json.dumps(results, indent=4)
+    if args.output is None:
+        sys.stdout.write(out + '\n')
+    else:
+        with open(args.output, 'w') as file:
+            file.write(out + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,244 @@
+""" Command line interface of snirf2bids
+
+    python -m snirf2bids convert raw/ 'more/**/*.snirf' -o bids/ --jobs 8
+    python -m snirf2bids validate raw/
+    python -m snirf2bids validate --tree bids/
+    python -m snirf2bids index bids/ --where task=tapping
+
+Maintained by the Boston University Neurophotonics Center
+"""
+
+import argparse
+import glob
+import os
+import sys
+import warnings
+
+from .snirf2bids import (BIDSIndex, DATA_MODES, LEVELS, ValidationReport, _INDEX, _convert_dataset, _find_snirf,
+                         _finding_message, _planned_outputs, subjects_from_snirf, validate_bids, validate_snirf,
+                         __version__)
+
+
+def _expand_inputs(patterns):
+    """Expands the input arguments into a list of SNIRF files
+
+        Args:
+            patterns: File paths, directories (searched recursively) or glob patterns ('**' matches subdirectories)
+
+        Returns:
+            The list of the file paths to the SNIRF files, without duplicates, in argument order
+
+        Raises:
+            FileNotFoundError: If an argument matches nothing
+    """
+
+    found = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        if not any(os.path.exists(match) for match in matches):
+            raise FileNotFoundError('No SNIRF file matches ' + pattern)
+        for match in matches:
+            if os.path.isdir(match):
+                found += _find_snirf(match)
+            elif match.endswith('.snirf') and os.path.isfile(match):
+                found.append(match)
+    return list(dict.fromkeys(found))
+
+
+def _input_root(inputpaths):
+    """The deepest directory containing every input file (the manifest keys are relative to it)"""
+    return os.path.commonpath([os.path.dirname(os.path.abspath(inputpath)) for inputpath in inputpaths])
+
+
+def _progress(quiet, failed):
+    """Makes the progress callback of dataset_to_bids, printing one line per file to stderr
+
+        Args:
+            quiet: Do not print anything
+            failed: A list the file paths to the files that failed to convert are appended to
+    """
+
+    def progress(done, total, inputpath, error):
+        if error is not None:
+            failed.append(inputpath)
+        if not quiet:
+            status = '' if error is None else ' FAILED: ' + repr(error)
+            sys.stderr.write('[' + str(done) + '/' + str(total) + '] ' + inputpath + status + '\n')
+            sys.stderr.flush()
+    return progress
+
+
+def convert(args):
+    """The convert command: converts SNIRF files into a BIDS dataset"""
+    inputpaths = _expand_inputs(args.inputs)
+    if args.dry_run:
+        for inputpath in inputpaths:
+            subjs = subjects_from_snirf(inputpath, lazy=True)
+            for fname in _planned_outputs(subjs, args.data_mode):
+                sys.stdout.write(inputpath + '\t' + os.path.join(args.output, fname) + '\n')
+        return 0
+    if not inputpaths:
+        return 0
+
+    failed = []
+    with warnings.catch_warnings():
+        if args.quiet:
+            warnings.simplefilter('ignore')
+        converted = _convert_dataset(inputpaths, _input_root(inputpaths), args.output, args.jobs,
+                                     not args.force, args.checksum, args.data_mode, _progress(args.quiet, failed))
+    if not args.quiet:
+        sys.stderr.write(str(len(converted)) + ' converted, ' + str(len(failed)) + ' failed, ' +
+                         str(len(inputpaths) - len(converted) - len(failed)) + ' up to date\n')
+    return 1 if failed else 0
+
+
+def validate(args):
+    """The validate command: reports the missing fields of the runs of SNIRF files (or of BIDS datasets)"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        if not args.tree:
+            report = validate_snirf(_expand_inputs(args.inputs), args.jobs, args.level, args.fail_level,
+                                    _progress(args.quiet, []))
+        else:
+            report = ValidationReport(args.fail_level)
+            for output_root in args.inputs:
+                tree = validate_bids(output_root, args.jobs, args.level, args.fail_level, _progress(args.quiet, []))
+                report.add(tree.findings, tree.runs)
+                report.errors += tree.errors
+
+    for finding in report.findings:
+        sys.stdout.write(finding['source'] + '\t' + _finding_message(finding) + '\n')
+    for source, message in report.errors:
+        sys.stdout.write(source + '\tFATAL: ' + message + '\n')
+    if args.json is not None:
+        report.save(args.json)
+    if not args.quiet:
+        counts = report.counts()
+        sys.stderr.write(str(report.runs) + ' runs checked, ' + str(len(report.failed())) + ' failed (' +
+                         ', '.join(str(counts[level]) + ' ' + level for level in reversed(LEVELS)) + ')\n')
+    return 0 if report.passed else 1
+
+
+def _load_index(inputs):
+    """Loads a saved BIDSIndex or builds one from SNIRF files
+
+        Args:
+            inputs: A BIDS dataset root (with a saved index), a saved index file (.npz) or SNIRF inputs
+
+        Returns:
+            The BIDSIndex
+    """
+
+    if len(inputs) == 1 and os.path.isfile(os.path.join(inputs[0], _INDEX)):
+        return BIDSIndex.load(os.path.join(inputs[0], _INDEX))
+    if len(inputs) == 1 and inputs[0].endswith('.npz'):
+        return BIDSIndex.load(inputs[0])
+
+    index = BIDSIndex()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for inputpath in _expand_inputs(inputs):
+            for subj in subjects_from_snirf(inputpath):
+                index.add(subj)
+    return index
+
+
+def index(args):
+    """The index command: queries (and optionally saves) a BIDSIndex"""
+    bids_index = _load_index(args.inputs)
+
+    criteria = {}
+    for condition in args.where:
+        name, sep, value = condition.partition('=')
+        if not sep:
+            raise ValueError('Expected KEY=VALUE, got ' + condition)
+        try:
+            column = [x for x in bids_index.column(name) if x is not None]
+        except KeyError:
+            column = []
+        if column and all(isinstance(x, float) for x in column):
+            criteria[name] = float(value)
+        else:
+            criteria[name] = value
+
+    if args.save is not None:
+        bids_index.save(args.save)
+
+    rows = bids_index.query(**criteria)
+    columns = []
+    for row in rows:
+        columns += [name for name in row if name not in columns]
+    if args.columns:
+        columns = args.columns.split(',')
+    if rows:
+        sys.stdout.write('\t'.join(columns) + '\n')
+    for row in rows:
+        sys.stdout.write('\t'.join('n/a' if row.get(name) is None else str(row[name]) for name in columns) + '\n')
+    return 0
+
+
+def _parser():
+    """Builds the argument parser"""
+    parser = argparse.ArgumentParser(prog='snirf2bids', description='Convert SNIRF files into a BIDS dataset.')
+    parser.add_argument('--version', action='version', version='snirf2bids ' + __version__)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_common(command):
+        command.add_argument('inputs', nargs='+', help='SNIRF files, directories (searched recursively) or glob '
+                                                       'patterns')
+        command.add_argument('-j', '--jobs', type=int, default=None,
+                             help='number of worker processes (default: number of CPUs, 1: no worker processes)')
+        command.add_argument('-q', '--quiet', action='store_true', help='no progress report')
+
+    command = commands.add_parser('convert', help='convert SNIRF files into a BIDS dataset')
+    add_common(command)
+    command.add_argument('-o', '--output', required=True, help='root directory of the BIDS dataset')
+    command.add_argument('--data-mode', choices=DATA_MODES, default=None,
+                         help='also place the SNIRF data files in the dataset (default: metadata files only)')
+    command.add_argument('--force', action='store_true', help='convert files that are up to date too')
+    command.add_argument('--checksum', action='store_true', help='compare file hashes to detect changed files')
+    command.add_argument('-n', '--dry-run', action='store_true', help='list the files that would be written')
+    command.set_defaults(run=convert)
+
+    command = commands.add_parser('validate', help='report the missing BIDS fields of the runs of SNIRF files')
+    add_common(command)
+    command.add_argument('--level', choices=LEVELS, default='RECOMMENDED',
+                         help='least severe requirement level reported (default: RECOMMENDED)')
+    command.add_argument('--fail-level', choices=LEVELS, default='REQUIRED',
+                         help='least severe requirement level that fails a run (default: REQUIRED)')
+    command.add_argument('--json', metavar='FILE', help='write the report as JSON')
+    command.add_argument('--tree', action='store_true',
+                         help='the inputs are the roots of BIDS datasets, whose metadata files are checked instead')
+    command.set_defaults(run=validate)
+
+    command = commands.add_parser('index', help='query the index of a BIDS dataset or of SNIRF files')
+    command.add_argument('inputs', nargs='+', help='a BIDS dataset root or index file (.npz), or SNIRF files, '
+                                                   'directories or glob patterns to index')
+    command.add_argument('-w', '--where', action='append', default=[], metavar='KEY=VALUE',
+                         help='keep the runs with this value (repeatable), for example task=tapping')
+    command.add_argument('--columns', help='comma-separated list of the columns to print')
+    command.add_argument('--save', metavar='FILE', help='save the index (.npz)')
+    command.set_defaults(run=index)
+    return parser
+
+
+def main(argv=None):
+    """Command line entry point (python -m snirf2bids)
+
+        Args:
+            argv: The command line arguments (default: sys.argv[1:])
+
+        Returns:
+            The exit status: 0 on success, 1 if a file failed, 2 on usage errors
+    """
+
+    parser = _parser()
+    args = parser.parse_args(argv)
+    try:
+        return args.run(args)
+    except (FileNotFoundError, ValueError) as e:
+        parser.exit(2, 'snirf2bids: error: ' + str(e) + '\n')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,10 +4,31 @@ Maintained by the Boston University Neurophotonics Center
 """
 
 import numpy as np
+import h5py
 import json
 from pysnirf2 import Snirf
 from warnings import warn
 import csv
+import glob
+import hashlib
+import mmap
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache, partial
+from time import perf_counter
+from importlib import resources
+from types import MappingProxyType
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 try:
     from snirf2bids.__version__ import __version__ as __version__
@@ -16,16 +37,63 @@ except ImportError:
     __version__ = '0.0.0'
 
 
+# The schema tables ship as package data in snirf2bids/defaults and are resolved relative to the package, not to the
+# current working directory
+_DEFAULTS_FILES = ('BIDS_fNIRS_measurement_type.json',
+                   'BIDS_fNIRS_sidecar_files.json',
+                   'BIDS_fNIRS_subject_folder.json',
+                   'BIDS_fNIRS_subject_folder_datatype.json',
+                   'BIDS_raw_folder.json')
+_DEFAULTS = None
+_FIELD_SCHEMAS = {}  # metadata class -> default (name, Field class) pairs, see Metadata._schema
+_RULES = {}  # defaults key of a file -> compiled validation rules, see _rules
+
+
+def _freeze(value):
+    """Recursively wraps dictionaries loaded from the defaults JSON files into read-only mappings"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(val) for key, val in value.items()})
+    return value
+
+
+def reload_defaults():
+    """(Re)load every JSON file in the package's defaults folder into the in-process schema registry
+
+        The registry is built once, on the first lookup, and reused by every later _getdefault call. Call this function
+        to pick up edits made to the defaults JSON files while the process is running.
+
+        Returns:
+            The read-only registry, keyed by (JSON file name, key) pairs
+    """
+    global _DEFAULTS
+
+    registry = {}
+    with _stage('defaults'):
+        defaults = resources.files('snirf2bids').joinpath('defaults')
+        for fname in _DEFAULTS_FILES:
+            fields = json.loads(defaults.joinpath(fname).read_text())
+            for key, value in fields.items():
+                registry[(fname, key)] = _freeze(value)
+
+    _DEFAULTS = MappingProxyType(registry)
+    _FIELD_SCHEMAS.clear()
+    _RULES.clear()
+    return _DEFAULTS
+
+
 def _getdefault(fpath, key):
     """Get the fields/keys and corresponding values/descriptions from a JSON file.
 
+        The JSON files are parsed once into an in-process registry (see reload_defaults), so that every lookup is a
+        single dictionary access.
+
         Args:
-            fpath: The filepath to the JSON file containing the list of default fields (in string)
+            fpath: The JSON file name (within the defaults folder) containing the list of default fields (in string)
             key: The specific Metadata file extension such as _nirs.json, _optodes.tsv, etc. or specific key/field
                  declared within the dictionary in the JSON file.
 
         Returns:
-            The dictionary stored within the specific key/field.
+            The (read-only) dictionary stored within the specific key/field.
             Example output for _coordsystem.json from BIDS_fNIRS_subject_folder.JSON:
                 {'RequirementLevel': 'CONDITIONAL',
                  'NIRSCoordinateSystem': 'REQUIRED',
@@ -34,44 +102,470 @@ def _getdefault(fpath, key):
                  'NIRSCoordinateProcessingDescription': 'RECOMMENDED',
                  ...
                  'FiducialsDescription': 'OPTIONAL'}
+
+        Raises:
+            KeyError: If the key/field is not declared within the JSON file
+    """
+    registry = _DEFAULTS if _DEFAULTS is not None else reload_defaults()
+
+    return registry[(fpath, key)]
+
+
+# Profiling: the conversion pipeline is split into named stages (see _stage). While no Profiler is active, a stage is a
+# shared no-op context manager, so the instrumentation costs one list check per stage. Opens and bytes are counted per
+# thread, so that stages running at the same time on different threads (the ExportWriter writes) are kept apart.
+_PROFILERS = []
+_NO_STAGE = nullcontext()
+_OPENS = threading.local()  # file opens of the thread counted while a Profiler is active (count attribute)
+_PROC_IO = '/proc/thread-self/io' if os.path.exists('/proc/thread-self/io') else '/proc/self/io'
+_AUDIT_HOOK = []
+
+
+def _count_open():
+    """Counts a file open of the calling thread"""
+    _OPENS.count = getattr(_OPENS, 'count', 0) + 1
+
+
+def _audit(event, args):
+    """Counts the file opens made from Python (builtin open, os.open) while a Profiler is active"""
+    if event == 'open' and _PROFILERS and args[0] != _PROC_IO:
+        _count_open()
+
+
+def _io_counters():
+    """Reads the bytes read and written by the calling thread so far (by the process on systems without per-thread
+    counters; None where the OS does not report them)"""
+    try:
+        with open(_PROC_IO) as file:
+            counters = dict(line.split(': ') for line in file.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+class _ProfiledStage:
+    """Context manager measuring a single stage for the active Profilers (see _stage)"""
+
+    __slots__ = ('name', 'fpath', '_start')
+
+    def __init__(self, name, fpath):
+        self.name = name
+        self.fpath = fpath
+        self._start = None
+
+    def __enter__(self):
+        self._start = (perf_counter(), getattr(_OPENS, 'count', 0)) + _io_counters()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        end = (perf_counter(), getattr(_OPENS, 'count', 0)) + _io_counters()
+        record = {'stage': self.name, 'file': self.fpath, 'time': end[0] - self._start[0],
+                  'opens': end[1] - self._start[1], 'bytes_read': None, 'bytes_written': None,
+                  'error': exc_type is not None}
+        if end[2] is not None and self._start[2] is not None:
+            record['bytes_read'] = end[2] - self._start[2]
+            record['bytes_written'] = end[3] - self._start[3]
+        for profiler in list(_PROFILERS):
+            profiler.add(record)
+
+
+def _stage(name, fpath=None):
+    """Marks a stage of the conversion pipeline for the active Profilers
+
+        Args:
+            name: The stage name, for example 'open' or 'load:channel'
+            fpath: The file path to the SNIRF file the stage works on, or a SnirfSnapshot of it
+
+        Returns:
+            A context manager measuring the stage (a no-op when no Profiler is active)
+    """
+
+    if not _PROFILERS:
+        return _NO_STAGE
+    return _ProfiledStage(name, _snirf_path(fpath))
+
+
+class Profiler:
+    """Per-stage profiler of the conversion pipeline
+
+    While the profiler is active (as a context manager), every stage of the conversion reports a record with its name
+    ('open', 'defaults', 'load:<component>', 'export', 'check', 'convert', ...), the SNIRF file it works on, its wall
+    time in seconds, the number of files opened and the bytes read and written by the thread running the stage (None
+    where the OS does not report them). Stages nest: the 'convert' stage of a file contains the stages of its runs,
+    except for the 'export' stage of every metadata file, which runs on the ExportWriter thread writing the file (in
+    snirf_to_bids the wall time of 'convert' includes waiting for these writes, but not their opens and bytes;
+    dataset_to_bids drains the writes of a batch of files once, between the extraction and the placement of each
+    file, both recorded as 'convert').
+
+    Attributes:
+        records: The list of records, in completion order
+        callback: Optional function called with every record as soon as the stage completes
+    """
+
+    def __init__(self, callback=None):
+        """Constructor for the Profiler class
+
+        Args:
+            callback: Optional function called as callback(record) after every stage
+        """
+
+        self.records = []
+        self.callback = callback
+
+    def __enter__(self):
+        if not _AUDIT_HOOK:
+            sys.addaudithook(_audit)
+            _AUDIT_HOOK.append(_audit)
+        _PROFILERS.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _PROFILERS.remove(self)
+
+    def add(self, record):
+        """Adds a stage record (called by the pipeline)
+
+            Args:
+                record: The record dictionary
+        """
+
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def totals(self, key='time'):
+        """Sums a measurement per stage and file
+
+            Args:
+                key: The measurement: 'time', 'opens', 'bytes_read' or 'bytes_written'
+
+            Returns:
+                A dictionary keyed by stage name of dictionaries keyed by file path
+        """
+
+        totals = {}
+        for record in self.records:
+            if record[key] is not None:
+                files = totals.setdefault(record['stage'], {})
+                files[record['file']] = files.get(record['file'], 0) + record[key]
+        return totals
+
+    def summary(self, key='time'):
+        """Summarizes a measurement per stage
+
+            Args:
+                key: The measurement: 'time', 'opens', 'bytes_read' or 'bytes_written'
+
+            Returns:
+                A dictionary keyed by stage name with the number of files, the total, mean and maximum per file
+        """
+
+        summary = {}
+        for stage, files in self.totals(key).items():
+            values = list(files.values())
+            summary[stage] = {'files': len(values), 'total': sum(values), 'mean': sum(values) / len(values),
+                              'max': max(values)}
+        return summary
+
+    def histogram(self, stage, key='time', bins=10):
+        """Histogram of a measurement of a stage across files (for batch runs)
+
+            Args:
+                stage: The stage name
+                key: The measurement: 'time', 'opens', 'bytes_read' or 'bytes_written'
+                bins: The number of bins or the bin edges (see numpy.histogram)
+
+            Returns:
+                The (counts, bin edges) arrays
+        """
+
+        values = list(self.totals(key).get(stage, {}).values())
+        return np.histogram(np.array(values, dtype=float), bins=bins)
+
+    def save(self, fpath):
+        """Saves the records as a JSON file
+
+            Args:
+                fpath: The file path to the output JSON file
+        """
+
+        with open(fpath, 'w') as file:
+            json.dump(self.records, file, indent=4)
+
+
+class SnirfSnapshot:
+    """Shared extraction context for a single SNIRF file
+
+    The SNIRF file is opened once (read-only, with dynamic loading so that only the datasets that are accessed are
+    read from disk) and the same handle is handed to every metadata class of a Subject, instead of each class
+    opening the file on its own.
+
+    Attributes:
+        fpath: The file path to the reference SNIRF file
+        _snirf: The open pysnirf2 Snirf object (None until the file is first accessed or after it is closed)
+    """
+
+    def __init__(self, fpath):
+        """Constructor for the SnirfSnapshot class
+
+            Args:
+                fpath: The file path to the reference SNIRF file
+        """
+        self.fpath = fpath
+        self._snirf = None
+
+    @property
+    def snirf(self):
+        """Open SNIRF file handle getter (the file is opened on first access)"""
+        if self._snirf is None:
+            with _stage('open', self.fpath):
+                if _PROFILERS:
+                    _count_open()
+                self._snirf = Snirf(self.fpath, 'r', dynamic_loading=True)
+        return self._snirf
+
+    def close(self):
+        """Closes the underlying SNIRF file handle if it is open"""
+        if self._snirf is not None:
+            self._snirf.close()
+            self._snirf = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getstate__(self):
+        """Drops the open file handle when pickled (it is reopened on first access)"""
+        state = self.__dict__.copy()
+        state['_snirf'] = None
+        return state
+
+
+@contextmanager
+def _open_snirf(fpath):
+    """Yields an open Snirf object for either a file path or a SnirfSnapshot
+
+        A SnirfSnapshot is left open so that it can be shared with the other metadata classes; a file path is opened
+        for the duration of the with-block only.
+
+        Args:
+            fpath: The file path to the reference SNIRF file or a SnirfSnapshot of it
     """
-    file = open('defaults/' + fpath)
-    fields = json.load(file)
+    if isinstance(fpath, SnirfSnapshot):
+        yield fpath.snirf
+    else:
+        with SnirfSnapshot(fpath) as snapshot:
+            yield snapshot.snirf
+
+
+def _snirf_path(fpath):
+    """Returns the file path of the reference SNIRF file for either a file path or a SnirfSnapshot"""
+    if isinstance(fpath, SnirfSnapshot):
+        return fpath.fpath
+    return fpath
+
+
+def _read_string(dataset):
+    """Reads an HDF5 string dataset (scalar or array) as str"""
+    value = dataset[()]
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if isinstance(value, np.ndarray) and value.dtype.kind in 'SO':
+        return np.array([v.decode('utf-8') if isinstance(v, bytes) else str(v) for v in value.ravel()])
+    return value
+
+
+# measurementList fields without a default: the channel rows are built from the probe entries they point to
+_INDEX_FIELDS = ('sourceIndex', 'detectorIndex', 'wavelengthIndex')
 
-    return fields[key]
 
+def _read_measurement_list(data):
+    """Reads the measurementList of a SNIRF data block in bulk, as one array per field
 
-def _pull_label(fpath, field):
-    """Pull information values from filename if it is BIDS compliant
+        Both the indexed measurementList{k} groups and the array-based measurementLists group (SNIRF v1.1) are
+        supported. The datasets are read straight from the HDF5 group, without building a pysnirf2 object for every
+        measurement.
 
         Args:
-            fpath: The filepath to the SNIRF file of reference
-            field: The specific participant information field inquired (sub-/ses-/run-/task-)
+            data: The pysnirf2 data element (for example s.nirs[0].data[0])
 
         Returns:
-            The label for the specified field or None if the specific field cannot be found in the filename
+            A dictionary with the integer arrays sourceIndex, detectorIndex, wavelengthIndex and dataType (0 where it
+            is absent) and the string array dataTypeLabel ('' where the label is absent)
 
         Raises:
-            ValueError: If field is sub- or task- and is not clarified in the file name
+            ValueError: If a measurement has no sourceIndex, detectorIndex or wavelengthIndex
     """
 
-    if fpath is None:
-        return None
-    fname = fpath.split('/')[-1]
-    if field not in fname and field == 'sub-':
+    group = data._h
+    int_fields = ['sourceIndex', 'detectorIndex', 'wavelengthIndex', 'dataType']
+
+    if 'measurementLists' in group:
+        lists = group['measurementLists']
+        for field in _INDEX_FIELDS:
+            if field not in lists:
+                raise ValueError('The measurementLists of ' + group.name + ' have no ' + field)
+        count = len(lists['sourceIndex'])
+        ml = {name: np.asarray(lists[name][()], dtype=int).ravel() if name in lists else np.zeros(count, dtype=int)
+              for name in int_fields}
+        if 'dataTypeLabel' in lists:
+            ml['dataTypeLabel'] = np.asarray(_read_string(lists['dataTypeLabel']), dtype=str).ravel()
+        else:
+            ml['dataTypeLabel'] = np.full(count, '')
+        return ml
+
+    names = [name for name in group if name.startswith('measurementList') and name[15:].isdigit()]
+    names.sort(key=lambda name: int(name[15:]))
+    ml = {name: np.zeros(len(names), dtype=int) for name in int_fields}
+    labels = [''] * len(names)
+
+    # The low-level h5py API skips the per-object overhead of the high-level Group/Dataset wrappers, which dominates
+    # when reading thousands of scalar datasets
+    buffer = np.zeros(1, dtype=int)
+    for i, name in enumerate(names):
+        prefix = name.encode() + b'/'
+        for field in int_fields:
+            try:
+                dataset = h5py.h5d.open(group.id, prefix + field.encode())
+            except KeyError:
+                if field in _INDEX_FIELDS:
+                    raise ValueError('The ' + name + ' of ' + group.name + ' has no ' + field) from None
+                continue
+            dataset.read(h5py.h5s.ALL, h5py.h5s.ALL, buffer)
+            ml[field][i] = buffer[0]
+        if name + '/dataTypeLabel' in group:
+            labels[i] = _read_string(group[name + '/dataTypeLabel'])
+    ml['dataTypeLabel'] = np.array(labels, dtype=str)
+    return ml
+
+
+def _probe_entries(values, ml, field):
+    """Looks up the probe entries (labels, wavelengths) a measurementList index field points to
+
+        Args:
+            values: The probe array
+            ml: The measurementList arrays (see _read_measurement_list)
+            field: The index field, for example 'sourceIndex'
+
+        Returns:
+            The array of the entries of every measurement
+
+        Raises:
+            ValueError: If an index is not between 1 and the length of the probe array
+    """
+
+    index = ml[field]
+    if index.size and (index.min() < 1 or index.max() > len(values)):
+        raise ValueError('A measurementList ' + field + ' is out of the range of the ' + str(len(values)) +
+                         ' probe entries')
+    return values[index - 1]
+
+
+def _measurement_count(data):
+    """Counts the channels (measurementList entries) of a SNIRF data block without reading them
+
+        Args:
+            data: The pysnirf2 data element (for example s.nirs[0].data[0])
+
+        Returns:
+            The number of channels
+    """
+
+    group = data._h
+    if 'measurementLists' in group:
+        return group['measurementLists']['sourceIndex'].shape[0]
+    return sum(1 for name in group if name.startswith('measurementList') and name[15:].isdigit())
+
+
+def _read_timing(data):
+    """Reads the time axis of a SNIRF data block without reading its time series
+
+        The compact two-element [start, step] form of the time vector is used as is. Otherwise only the first and last
+        time points are read: the mean of the time steps is (last - first) / (samples - 1).
+
+        Args:
+            data: The pysnirf2 data element (for example s.nirs[0].data[0])
+
+        Returns:
+            The (time step, duration) of the block in time units, or (None, None) with fewer than 2 samples
+    """
+
+    group = data._h
+    time = group['time']
+    count = time.shape[0]
+    samples = group['dataTimeSeries'].shape[0] if 'dataTimeSeries' in group else count
+
+    if count == 2 and samples != 2:
+        start, step = np.ravel(time[()]).astype(float)
+        return step, step * (samples - 1)
+    if count < 2:
+        return None, None
+    first = float(np.ravel(time[0])[0])
+    last = float(np.ravel(time[count - 1])[0])
+    return (last - first) / (count - 1), last - first
+
+
+# One key-label entity ('task-tapping') or a suffix ('nirs') of a file name, with the underscore that ends it
+_NAME_TOKEN = re.compile(r'(?:([a-zA-Z]+)-([^_]*)|([^_]+))(?:_|\Z)')
+
+
+def parse_bids_name(fpath):
+    """Parse every entity and the suffix of a BIDS file name in a single pass
+
+        Args:
+            fpath: A file path or name (or a SnirfSnapshot); folders and the extension are ignored
+
+        Returns:
+            A (entities, suffix) pair: a dictionary of the labels keyed by entity ('sub-', 'task-', ...), in file name
+            order, and the suffix (None if the name ends with an entity)
+            Example: ({'sub-': '01', 'task-': 'tapping'}, 'nirs') for sub-01_task-tapping_nirs.snirf
+
+        Raises:
+            ValueError: If a label is not alphanumeric or an entity appears twice
+    """
+
+    fname = _snirf_path(fpath).rsplit('/', 1)[-1]
+    extension = fname.find('.', fname.rfind('_') + 1)
+    if extension >= 0:
+        fname = fname[:extension]
+    entities = {}
+    suffix = None
+    for key, label, token in _NAME_TOKEN.findall(fname):
+        if token:
+            suffix = token
+            continue
+        entity = key + '-'
+        if entity in entities:
+            raise ValueError('The ' + entity + ' entity appears twice in ' + fname)
+        if label and not (label.isalnum() and label.isascii()):
+            raise ValueError('The ' + entity + ' label ' + repr(label) + ' is not alphanumeric')
+        entities[entity] = label or None
+    return entities, suffix
+
+
+def _subject_labels(fpath):
+    """Pull the subject info labels from the file name of a SNIRF file (see parse_bids_name)
+
+        Args:
+            fpath: The filepath to the SNIRF file of reference (or a SnirfSnapshot of it)
+
+        Returns:
+            The labels of sub-, ses-, task- and run- (None when absent) and of the other BIDS entities of the name
+
+        Raises:
+            ValueError: If the subject or task label is not in the file name, or a label is not alphanumeric
+    """
+
+    entities = parse_bids_name(fpath)[0]
+    if entities.get('sub-') is None:
         raise ValueError('Subject label is REQUIRED in file name')
-    elif field not in fname and field == 'task-':
+    elif entities.get('task-') is None:
         raise ValueError('Task label is REQUIRED in file name')
-    else:
-        # if it is mentioned in the filename
-        info = fname.split('_')
-        for i in info:
-            if field in i:
-                if np.size(i.split(field)) == 1:
-                    return None
-                else:
-                    return i.split(field)[1]
-                    # need to get rid of non-alphanumeric for task name
+    labels = {entity: entities.get(entity) for entity in ('sub-', 'ses-', 'task-', 'run-')}
+    labels.update((entity, entities[entity]) for entity in _ENTITIES if entities.get(entity) is not None)
+    return labels
 
 
 def _makefiledir(info, classname, fpath, sidecar=None):
@@ -98,6 +592,82 @@ def _makefiledir(info, classname, fpath, sidecar=None):
     return filedir
 
 
+# BIDS entities, in the order they appear in file names
+_ENTITIES = ('sub-', 'ses-', 'task-', 'acq-', 'rec-', 'dir-', 'run-', 'recording-', 'proc-', 'desc-')
+# Entities of the names of the session-level files (optodes, coordsystem) and of the scans file
+_SESSION_ENTITIES = ('sub-', 'ses-', 'acq-')
+_SCANS_ENTITIES = ('sub-', 'ses-')
+
+
+@lru_cache(maxsize=4096)
+def _filename_table_for(labels):
+    """Builds the file name table of a set of entity labels (see _filename_table)
+
+        Args:
+            labels: A tuple of (entity, label) pairs, in _ENTITIES order
+
+        Returns:
+            The read-only file name table
+
+        Raises:
+            ValueError: If there is no subject label or a label is not alphanumeric
+    """
+
+    labels = dict(labels)
+    if 'sub-' not in labels:
+        raise ValueError('Subject label is REQUIRED in file name')
+    for entity, label in labels.items():
+        if not (label.isalnum() and label.isascii()):
+            raise ValueError('The ' + entity + ' label ' + repr(label) + ' is not alphanumeric')
+
+    def stem(entities):
+        return '_'.join(entity + labels[entity] for entity in entities if entity in labels)
+
+    session = stem(_SESSION_ENTITIES)
+    run = stem(_ENTITIES)
+    table = {
+        ('optodes', None): session + '_optodes.tsv',
+        ('optodes', 'sidecar'): session + '_optodes.json',
+        ('coordsystem', None): session + '_coordsystem.json',
+        ('channels', None): run + '_channels.tsv',
+        ('channels', 'sidecar'): run + '_channels.json',
+        ('events', None): run + '_events.tsv',
+        ('events', 'sidecar'): run + '_events.json',
+        ('sidecar', None): run + '_nirs.json',
+        ('nirs', None): run + '_nirs.snirf',
+        ('scans', 'init'): run,
+        ('scans', None): stem(_SCANS_ENTITIES) + '_scans.tsv',
+        ('subjdir', None): 'sub-' + labels['sub-'] + ('/ses-' + labels['ses-'] if 'ses-' in labels else ''),
+    }
+    return MappingProxyType(table)
+
+
+def _filename_table(info):
+    """Get the table of every BIDS file name of a 'subject'/run
+
+        The table is built once per distinct set of labels and shared afterwards, so every writer looking up a file
+        name of the same run reuses the same strings. Entities appear in the BIDS order of _ENTITIES: session-level
+        files (optodes, coordsystem) keep sub-, ses- and acq-, the scans file sub- and ses-, and the run-level files
+        every entity.
+
+        Args:
+            info: Subject info field from the Subject class (entity -> label, None when absent)
+
+        Returns:
+            A read-only dictionary of file names keyed by (classname, parameter), as for _make_filename, and of the
+            relative subject/session folder keyed by ('subjdir', None)
+
+        Raises:
+            ValueError: If an entity is not a known BIDS entity, there is no subject label or a label is not
+                alphanumeric
+    """
+
+    for entity in info:
+        if entity not in _ENTITIES:
+            raise ValueError('Unknown BIDS entity ' + repr(entity))
+    return _filename_table_for(tuple((entity, info[entity]) for entity in _ENTITIES if info.get(entity) is not None))
+
+
 def _make_filename(classname, info, parameter=None):
     """Make file names based on file info
 
@@ -107,51 +677,41 @@ def _make_filename(classname, info, parameter=None):
             parameter: Enter 'sidecar' when creating a TSV-accompanying sidecar file
 
         Returns:
-            A BIDS formatted file name for the specific metadata file (in string)
+            A BIDS formatted file name for the specific metadata file (in string), looked up in the file name table
+            of info (see _filename_table), or None for an unknown classname/parameter
             Example: sub-01_task-tapping_nirs.json for a _nirs.json file
     """
 
-    subject = 'sub-' + info['sub-']
-    task = '_task-' + info['task-']
+    return _filename_table(info).get((classname, parameter))
 
-    if info['ses-'] is None:
-        session = ''
-    else:
-        session = '_ses-' + info['ses-']
 
-    if info['run-'] is None:
-        run = ''
-    else:
-        run = '_run-' + info['run-']
-
-    if classname == 'optodes' and parameter == 'sidecar':
-        return subject + session + '_optodes.json'
-    elif classname == 'optodes' and parameter is None:
-        return subject + session + '_optodes.tsv'
-    elif classname == 'coordsystem':
-        return subject + session + '_coordsystem.json'
-    elif classname == 'events' and parameter == 'sidecar':
-        return subject + session + task + run + '_events.json'
-    elif classname == 'events' and parameter is None:
-        return subject + session + task + run + '_events.tsv'
-    elif classname == 'sidecar':
-        return subject + session + task + run + '_nirs.json'
-    elif classname == 'channels' and parameter == 'sidecar':
-        return subject + session + task + run + '_channels.json'
-    elif classname == 'channels' and parameter is None:
-        return subject + session + task + run + '_channels.tsv'
-    elif classname == 'scans' and parameter == 'init':
-        return subject + session + task + run
-
-
-def _pull_participant(field, fpath=None):
+# Subject attribute names whose _make_filename class name differs
+_FNAME_CLASSES = {'channel': 'channels'}
+
+
+def _make_subjdir(info):
+    """Make the relative BIDS subject (and session) folder path based on file info
+
+        Args:
+            info: Subject info field from the Subject class
+
+        Returns:
+            The relative folder path in string
+            Example: sub-01/ses-02 for a file with a session label, sub-01 otherwise
+    """
+
+    return _filename_table(info)[('subjdir', None)]
+
+
+def _pull_participant(field, fpath=None, block=(0, 0)):
     """Obtains the value for specific fields in the participants.tsv file (minimum functionality)
 
         Only works for a single SNIRF file for now with a predefined set of fields
 
         Args:
             field: The specific field/column name in the participants.tsv file
-            fpath: The file path that points to the folder where we intend to save the metadata file in
+            fpath: The file path to the reference SNIRF file or a SnirfSnapshot of it
+            block: The (nirs, data) block indices to extract the value from
 
         Returns:
             The value for the specific field/column specified in string or None if it does not exist in the SNIRF file
@@ -159,10 +719,10 @@ def _pull_participant(field, fpath=None):
     """
 
     if fpath is not None:
-        with Snirf(fpath) as s:
-            if s.nirs[0].metaDataTags.__contains__(field):
+        with _open_snirf(fpath) as s:
+            if s.nirs[block[0]].metaDataTags.__contains__(field):
                 # make sure the field exists, and then pull
-                value = s.nirs[0].metaDataTags.__getattribute__(field)
+                value = s.nirs[block[0]].metaDataTags.__getattribute__(field)
             else:
                 value = None
     else:
@@ -177,7 +737,7 @@ def _pull_participant(field, fpath=None):
     return value
 
 
-def _pull_scans(info, field, fpath=None):
+def _pull_scans(info, field, fpath=None, block=(0, 0)):
     """Creates the scans.tsv file
 
         Only works for a single SNIRF file for now with a predefined set of fields
@@ -185,7 +745,8 @@ def _pull_scans(info, field, fpath=None):
         Args:
             info: subject information field (Subject.subinfo)
             field: field within scans.tsv file (filename or acq_time)
-            fpath: file path of snirf file to extract scans.tsv from. OPTIONAL
+            fpath: file path of snirf file (or a SnirfSnapshot of it) to extract scans.tsv from. OPTIONAL
+            block: The (nirs, data) block indices to extract the acquisition time from
 
         Returns:
             The string of the requested field parameter extracted from the snirf in fpath or None if no file path is
@@ -195,11 +756,11 @@ def _pull_scans(info, field, fpath=None):
         return None
     else:
         if field == 'filename':
-            return 'nirs/' + _make_filename('scans', info, 'init') + '.snirf'
+            return 'nirs/' + _make_filename('nirs', info)
         elif field == 'acq_time':
-            with Snirf(fpath) as s:
-                date = s.nirs[0].metaDataTags.MeasurementDate
-                time = s.nirs[0].metaDataTags.MeasurementTime
+            with _open_snirf(fpath) as s:
+                date = s.nirs[block[0]].metaDataTags.MeasurementDate
+                time = s.nirs[block[0]].metaDataTags.MeasurementTime
                 hour_minute_second = time[:8]
                 if '.' in time:
                     for x in time[8:]:
@@ -223,43 +784,189 @@ def _pull_scans(info, field, fpath=None):
             return date + 'T' + hour_minute_second + decimal + zone
 
 
-def _compliancy_check(bids):
+def _compliancy_check(bids, flat=False):
     """Checks the BIDS compliancy by checking the values of required field. Prints warning if anything is missing.
 
         Args:
             bids: Subject class object that is trying to be exported
+            flat: The files are exported in the flat snirf_to_bids layout (see Validator.check)
 
         Raises:
             ValueError: If there is an invalid field found within a specific BIDS/Subject object
     """
 
-    subj_object = bids.__dict__.keys()
-    for x in subj_object:
-        if x in ['channel', 'coordsystem', 'events', 'optodes', 'sidecar']:
-            class_spec = bids.__dict__[x].default_fields()[0]
-            for field in class_spec.keys():
-                if class_spec[field] == 'REQUIRED' and bids.__dict__[x].__getattr__(field) is None:
-                    message = 'FATAL: The field ' + field + ' is REQUIRED in the ' + x.capitalize() + ' class'
-                    warn(message)
-        elif x in ['subinfo']:
-            pass
-        elif x in ['participants', 'scans']:
-            class_spec = _getdefault('BIDS_fNIRS_subject_folder.json', x + '.tsv')
-            for field in class_spec.keys():
-                if class_spec[field] == 'REQUIRED' and field not in bids.__dict__[x]:
-                    message = 'FATAL: The field ' + field + 'is REQUIRED in ' + x.capitalize()
-                    warn(message)
-        else:
+    for x in bids.__dict__.keys():
+        if not x.startswith('_') and x not in ['subinfo'] + list(bids.components):
             raise ValueError('There is an invalid field ' + x + ' within your BIDS object')
 
+    for finding in Validator('REQUIRED').check(bids, flat=flat):
+        warn(_finding_message(finding))
+
+
+def _format_column(column, float_format=None):
+    """Formats a (chunk of a) TSV column as strings
+
+        Args:
+            column: The column values (array-like)
+            float_format: printf-style format for floating point values (for example '%.4f'). The default writes the
+                shortest representation that round-trips
+
+        Returns:
+            A list of strings, with 'n/a' for missing (None or NaN) values
+    """
+
+    column = np.asarray(column)
+    if column.dtype.kind == 'f':
+        text = column.astype(str) if float_format is None else np.char.mod(float_format, column)
+        text = text.tolist()
+        for i in np.flatnonzero(np.isnan(column)):
+            text[i] = 'n/a'
+        return text
+    elif column.dtype.kind in 'iuU':
+        return column.astype(str).tolist()
+    elif column.dtype.kind == 'S':
+        return np.char.decode(column, 'utf-8').tolist()
+
+    text = []
+    for value in column.tolist():
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            text.append('n/a')
+        elif isinstance(value, float) and float_format is not None:
+            text.append(float_format % value)
+        elif isinstance(value, bytes):
+            text.append(value.decode('utf-8'))
+        else:
+            text.append(str(value))
+    return text
+
+
+def _column_chunk(column, start, stop):
+    """Slices rows [start, stop) out of a TSV column, padding short (or scalar) columns with None"""
+    if np.ndim(column) == 0:
+        return [column] * (stop - start)
+    chunk = column[start:stop]
+    if len(chunk) < stop - start:
+        chunk = list(chunk) + [None] * (stop - start - len(chunk))
+    return chunk
+
+
+def _write_tsv_columns(fname, names, columns, float_format=None, chunksize=8192):
+    """Writes typed columns to a TSV file, a chunk of rows at a time
+
+        The columns are never transposed or converted into a common (string) matrix: each chunk of rows is formatted
+        column by column and written straight to the file.
+
+        Args:
+            fname: The file path to the output TSV file
+            names: The column names
+            columns: The column values (arrays or lists; a scalar is repeated on every row)
+            float_format: printf-style format for floating point values (see _format_column)
+            chunksize: The number of rows formatted and written at a time
+    """
+
+    nrows = max([len(column) for column in columns if np.ndim(column) > 0], default=1 if columns else 0)
+    with open(fname, 'w', newline='') as tsvfile:
+        tsvfile.write('\t'.join(names) + '\r\n')
+        for start in range(0, nrows, chunksize):
+            stop = min(start + chunksize, nrows)
+            chunk = [_format_column(_column_chunk(column, start, stop), float_format) for column in columns]
+            tsvfile.write(''.join('\t'.join(row) + '\r\n' for row in zip(*chunk)))
+
+
+def _read_tsv_columns(fpath, memory_map=False):
+    """Reads a TSV file in a single pass, as one list of cells per column
+
+        Args:
+            fpath: The file path to the TSV file
+            memory_map: Read the file through a read-only memory map instead of buffered reads
+
+        Returns:
+            The column names and the list of columns (short rows are padded with 'n/a')
+    """
+
+    with open(fpath, 'rb') as file:
+        if memory_map and os.fstat(file.fileno()).st_size > 0:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                lines = iter(buffer.readline, b'')
+                names, rows = _split_tsv_lines(lines)
+        else:
+            names, rows = _split_tsv_lines(file)
+
+    columns = [list(column) for column in zip(*rows)] if rows else [[] for _ in names]
+    return names, columns
+
+
+def _read_tsv_header(fpath):
+    """Reads the column names of a TSV file and counts its rows, without splitting the rows into cells
+
+        Args:
+            fpath: The file path to the TSV file
+
+        Returns:
+            The column names and the number of (non-empty) rows
+    """
+
+    with open(fpath, 'rb') as file:
+        header = file.readline().decode('utf-8', errors='ignore').rstrip('\r\n').lstrip('\ufeff')
+        rows = sum(1 for line in file if line != b'\n' and line != b'\r\n')
+    return (header.split('\t') if header else []), rows
+
+
+def _split_tsv_lines(lines):
+    """Splits the (byte) lines of a TSV file into its header and rows of cells"""
+    names = None
+    rows = []
+    for line in lines:
+        line = line.decode('utf-8', errors='ignore').rstrip('\r\n')
+        if names is None:
+            names = line.lstrip('\ufeff').split('\t')
+            continue
+        if line == '':
+            continue
+        row = line.split('\t')
+        if len(row) < len(names):
+            row += ['n/a'] * (len(names) - len(row))
+        rows.append(row[:len(names)])
+    return (names if names is not None else []), rows
+
+
+def _typed_column(cells, field=None):
+    """Converts the cells of a TSV column into a typed array
+
+        Args:
+            cells: The list of cells (strings) of the column
+            field: The Field class of the column, if it is declared (String columns are kept as strings)
+
+        Returns:
+            An integer array if every cell is an integer, a float array (NaN for 'n/a') if every cell is a number or
+            'n/a', and a string array otherwise
+    """
+
+    text = np.array(cells, dtype=str)
+    if isinstance(field, String):
+        return text
+    try:
+        return text.astype(int)
+    except ValueError:
+        pass
+    try:
+        return np.where(text == 'n/a', 'nan', text).astype(float)
+    except ValueError:
+        return text
+
 
 class Field:
     """Class which encapsulates fields inside a Metadata class
 
+        Fields are slotted (no per-instance __dict__) to keep the many small field objects of large collections of
+        Metadata/Subject objects compact.
+
         Attributes:
             _value: The value of the field
     """
 
+    __slots__ = ('_value',)
+
     def __init__(self, val):
         """Generic constructor for a Field class
 
@@ -283,16 +990,15 @@ class String(Field):
 
         Attributes:
             _value: The value of the field
-            type: Data type of the field - in this case, it's "str"
+            type: Data type of the field (shared by the class) - in this case, it's "str"
     """
 
-    def __init__(self, val):
-        """Generic constructor for a String Field class inherited from the Field class
+    __slots__ = ()
+    type = str
 
-            Additionally, it stores the datatype which in this case, it is string
-        """
+    def __init__(self, val):
+        """Generic constructor for a String Field class inherited from the Field class"""
         super().__init__(val)
-        self.type = str
 
     @staticmethod
     def validate(val):
@@ -323,16 +1029,15 @@ class Number(Field):
 
         Attributes:
             _value: The value of the field
-            type: Data type of the field - in this case, it's "int"
+            type: Data type of the field (shared by the class) - in this case, it's "int"
     """
 
-    def __init__(self, val):
-        """Generic constructor for a Number Field class inherited from the Field class
+    __slots__ = ()
+    type = int
 
-            Additionally, it stores the datatype which in this case, it is integer
-        """
+    def __init__(self, val):
+        """Generic constructor for a Number Field class inherited from the Field class"""
         super().__init__(val)
-        self.type = int
 
     @staticmethod
     def validate(val):
@@ -366,24 +1071,39 @@ class Metadata:
     Attributes:
         _fields: A dictionary of the fields and the values contained in it for a specific Metadata class
         _source_snirf: The filepath to the reference SNIRF file to create the specific Metadata class
+        _sidecar: Contains the field names and descriptions for each field for the Sidecar JSON file (TSV classes)
     """
 
+    __slots__ = ('_fields', '_source_snirf', '_sidecar')
+
     def __init__(self):
         """Generic constructor for a Metadata class
 
         Most importantly, it constructs the default fields with empty values within _fields in a dictionary format
         """
-        default_list, default_type = self.default_fields()
-        default = {'path2origin': String(None)}
-        for name in default_list:
-            # assume they are all string now
-            if default_type[name] == 'String':
-                default[name] = String(None)
-            elif default_type[name] == 'Number':
-                default[name] = Number(None)
-
-        self._fields = default
+        self._fields = {name: field_type(None) for name, field_type in self._schema()}
         self._source_snirf = None
+        self._sidecar = None
+
+    def _schema(self):
+        """Obtains the (name, Field class) pairs of the default fields, built once per metadata class and shared by all
+        of its instances
+
+            Returns:
+                A tuple of (field name, String or Number) pairs, starting with path2origin
+        """
+        schema = _FIELD_SCHEMAS.get(type(self))
+        if schema is None:
+            default_list, default_type = self.default_fields()
+            schema = [('path2origin', String)]
+            for name in default_list:
+                # assume they are all string now
+                if default_type[name] == 'String':
+                    schema.append((name, String))
+                elif default_type[name] == 'Number':
+                    schema.append((name, Number))
+            schema = _FIELD_SCHEMAS[type(self)] = tuple(schema)
+        return schema
 
     def __setattr__(self, name, val):
         """Overwrites the attribute setter default function
@@ -398,13 +1118,13 @@ class Metadata:
         if name.startswith('_'):
             super().__setattr__(name, val)
 
-        elif name in self._fields.keys():
+        elif name in self._fields:
             if self._fields[name].validate(val):
                 self._fields[name].value = val
             else:
                 raise ValueError("Incorrect data type")
 
-        elif name not in self._fields.keys():
+        else:
             if name == 'sidecar':
                 self._sidecar = None
             elif String.validate(val):  # Use our static method to validate a guy of this type before creating it
@@ -424,7 +1144,7 @@ class Metadata:
                 The value contained in the specified field
         """
 
-        if name in self._fields.keys():
+        if not name.startswith('_') and name in self._fields:
             return self._fields[name].value  # Use the property of the Guy in our managed collection
         else:
             return super().__getattribute__(name)
@@ -529,6 +1249,8 @@ class JSON(Metadata):
 
     """
 
+    __slots__ = ()
+
     def __init__(self):
         """Generic constructor for JSON class - uses the one inherited from the Metadata class"""
         super().__init__()
@@ -589,21 +1311,22 @@ class TSV(Metadata):
             _sidecar: Contains the field names and descriptions for each field for the Sidecar JSON file
     """
 
-    def __init__(self):
-        """Generic Constructor for TSV class - uses the one inherited from the Metadata class
+    __slots__ = ()
 
-        Additionally, added the sidecar property for the Sidecar JSON files
-        """
+    def __init__(self):
+        """Generic Constructor for TSV class - uses the one inherited from the Metadata class (which also initializes
+        the _sidecar slot for the Sidecar JSON files)"""
         super().__init__()
-        self._sidecar = None
 
-    def save_to_tsv(self, info, fpath):
+    def save_to_tsv(self, info, fpath, float_format=None):
         """Save a TSV inherited class into an output TSV file with a BIDS-compliant name in the file directory
         designated by the user
 
             Args:
                 info: Subject info field from the Subject class
                 fpath: The file path that points to the folder where we intend to save the metadata file in
+                float_format: printf-style format for floating point values (for example '%.4f'). The default writes
+                    the shortest representation that round-trips
 
             Returns:
                 Outputs a metadata TSV file with BIDS-compliant name in the specified file path
@@ -612,51 +1335,47 @@ class TSV(Metadata):
         classname = self.get_class_name().lower()
         filedir = _makefiledir(info, classname, fpath)
 
-        # VARIABLE DECLARATION
-        fields = list(self._fields)[1:]  # extract all fields
-        values = list(self._fields.values())[1:]  # extract all values
-        values = [values[i].value for i in range(len(values))]  # organize all values
+        # columns with a value, in field order (path2origin is not a column)
+        fieldnames = []
+        columns = []
+        for name, field in self._fields.items():
+            if name != 'path2origin' and field.value is not None:
+                fieldnames.append(name)
+                columns.append(field.value)
 
-        # VARIABLE ORGANIZATION
-        fieldnames = []  # filter out the fieldnames with empty fields, and organize into row structure
-        for i in range(len(fields)):
-            if values[i] is not None:
-                fieldnames = np.append(fieldnames, fields[i])
-        valfiltered = list(filter(None.__ne__, values))  # remove all None fields
-        valfiltered = np.transpose(valfiltered)  # transpose into correct row structure
-        # if classname == 'channels':
-        #
-
-        # TSV FILE WRITING
-        with open(filedir, 'w', newline='') as tsvfile:
-            writer = csv.writer(tsvfile, dialect='excel-tab')  # writer setup in tsv format
-            writer.writerow(fieldnames)  # write fieldnames
-            writer.writerows(valfiltered)  # write rows
-
-    def load_from_tsv(self, fpath):
+        _write_tsv_columns(filedir, fieldnames, columns, float_format)
+
+    def load_from_tsv(self, fpath, memory_map=False, header_only=False):
         """Create the TSV metadata class from a TSV file
 
+            The file is read in a single pass and every column is stored as a typed array (see _typed_column).
+            Columns that are not declared in the defaults schema are added as new fields.
+
             Args:
                 fpath: The file path to the reference TSV file
-        """
-
-        with open(fpath, encoding="utf8", errors='ignore') as file:
-            csvreader = csv.reader(file)
-            names = next(csvreader)
+                memory_map: Read the file through a read-only memory map
+                header_only: Only read the column names and count the rows; the columns are stored as empty arrays
 
-            temp = ''.join(name for name in names)
-            if '\ufeff' in temp:
-                temp = temp.split('\ufeff')[1]
-            rows = temp.split('\t')
-
-            for onerow in csvreader:
-                row = ''.join(row for row in onerow)
-                row = row.split('\t')
-                rows = np.vstack((rows, row))
+            Returns:
+                The number of rows of the file
+        """
 
-        for i in range(len(rows[0])):
-            onename = rows[0][i]
-            self._fields[onename].value = rows[1:, i]
+        if header_only:
+            names, rows = _read_tsv_header(fpath)
+            columns = [[] for name in names]
+        else:
+            names, columns = _read_tsv_columns(fpath, memory_map)
+            rows = len(columns[0]) if columns else 0
+        for name, cells in zip(names, columns):
+            field = self._fields.get(name)
+            column = _typed_column(cells, field)
+            if field is not None:
+                field.value = column
+            elif column.dtype.kind == 'U':
+                self._fields[name] = String(column)
+            else:
+                self._fields[name] = Number(column)
+        return rows
 
     def make_sidecar(self):
         """Makes a dictionary with the default description noted in BIDS specification into the Sidecar dictionary
@@ -668,8 +1387,10 @@ class TSV(Metadata):
         d = dict.fromkeys(keylist)
         fields = _getdefault('BIDS_fNIRS_sidecar_files.json', self.get_class_name().lower())
         for x in keylist:
-            if d[x] is None:
+            if d[x] is None and x in fields:
                 d[x] = {'Description': fields[x]}
+            elif d[x] is None:
+                d[x] = {}  # column that is not described in the BIDS specification
         return d
 
     def export_sidecar(self, info, fpath):
@@ -698,29 +1419,33 @@ class Coordsystem(JSON):
     Class object that mimics and contains the data for the coordsystem.JSON metadata file
     """
 
-    def __init__(self, fpath=None):
+    __slots__ = ()
+
+    def __init__(self, fpath=None, block=(0, 0)):
         """Inherited constructor for the Coordsystem class
 
         Args:
-            fpath: The file path to a reference SNIRF file
+            fpath: The file path to a reference SNIRF file or a SnirfSnapshot of it
+            block: The (nirs, data) block indices to extract the metadata from
         """
 
         if fpath is not None:
             Metadata.__init__(self)
-            self.load_from_SNIRF(fpath)
+            self.load_from_SNIRF(fpath, block)
         else:
             Metadata.__init__(self)
 
-    def load_from_SNIRF(self, fpath):
+    def load_from_SNIRF(self, fpath, block=(0, 0)):
         """Creates the Coordsystem class based on information from a reference SNIRF file
 
             Args:
-                fpath: The file path to the reference SNIRF file
+                fpath: The file path to the reference SNIRF file or a SnirfSnapshot of it
+                block: The (nirs, data) block indices to extract the metadata from
         """
 
-        self._source_snirf = fpath
-        with Snirf(fpath) as s:
-            self._fields['NIRSCoordinateUnits'].value = s.nirs[0].metaDataTags.LengthUnit
+        self._source_snirf = _snirf_path(fpath)
+        with _open_snirf(fpath) as s:
+            self._fields['NIRSCoordinateUnits'].value = s.nirs[block[0]].metaDataTags.LengthUnit
 
 
 class Optodes(TSV):
@@ -729,47 +1454,60 @@ class Optodes(TSV):
     Class object that mimics and contains the data for the optodes.tsv metadata file
     """
 
-    def __init__(self, fpath=None):
+    __slots__ = ()
+
+    def __init__(self, fpath=None, block=(0, 0)):
         """Inherited constructor for the Optodes class
 
             Args:
-                fpath: The file path to a reference SNIRF file
+                fpath: The file path to a reference SNIRF file or a SnirfSnapshot of it
+                block: The (nirs, data) block indices to extract the metadata from
         """
         if fpath is not None:
             super().__init__()
-            self.load_from_SNIRF(fpath)
+            self.load_from_SNIRF(fpath, block)
             self._sidecar = self.make_sidecar()
         else:
             super().__init__()
 
-    def load_from_SNIRF(self, fpath):
+    def load_from_SNIRF(self, fpath, block=(0, 0)):
         """Creates the Optodes class based on information from a reference SNIRF file
 
             Args:
-                fpath: The file path to the reference SNIRF file
+                fpath: The file path to the reference SNIRF file or a SnirfSnapshot of it
+                block: The (nirs, data) block indices to extract the metadata from
         """
 
-        self._source_snirf = fpath
-
-        with Snirf(fpath) as s:
-            self._fields['name'].value = np.append(s.nirs[0].probe.sourceLabels,
-                                                   s.nirs[0].probe.detectorLabels)
-            self._fields['type'].value = np.append(['source'] * len(s.nirs[0].probe.sourceLabels),
-                                                   ['detector'] * len(s.nirs[0].probe.detectorLabels))
-            if s.nirs[0].probe.detectorPos2D is None and \
-                    s.nirs[0].probe.sourcePos2D is None:
-                self._fields['x'].value = np.append(s.nirs[0].probe.sourcePos3D[:, 0],
-                                                    s.nirs[0].probe.detectorPos3D[:, 0])
-                self._fields['y'].value = np.append(s.nirs[0].probe.sourcePos3D[:, 1],
-                                                    s.nirs[0].probe.detectorPos3D[:, 1])
-                self._fields['z'].value = np.append(s.nirs[0].probe.sourcePos3D[:, 2],
-                                                    s.nirs[0].probe.detectorPos3D[:, 2])
-            elif s.nirs[0].probe.detectorPos3D is None and \
-                    s.nirs[0].probe.sourcePos3D is None:
-                self._fields['x'].value = np.append(s.nirs[0].probe.sourcePos2D[:, 0],
-                                                    s.nirs[0].probe.detectorPos2D[:, 0])
-                self._fields['y'].value = np.append(s.nirs[0].probe.sourcePos2D[:, 1],
-                                                    s.nirs[0].probe.detectorPos2D[:, 1])
+        self._source_snirf = _snirf_path(fpath)
+
+        with _open_snirf(fpath) as s:
+            nirs = s.nirs[block[0]]
+            self._fields['name'].value = np.append(nirs.probe.sourceLabels,
+                                                   nirs.probe.detectorLabels)
+            self._fields['type'].value = np.append(['source'] * len(nirs.probe.sourceLabels),
+                                                   ['detector'] * len(nirs.probe.detectorLabels))
+            if nirs.probe.detectorPos2D is None and \
+                    nirs.probe.sourcePos2D is None:
+                self._fields['x'].value = np.append(nirs.probe.sourcePos3D[:, 0],
+                                                    nirs.probe.detectorPos3D[:, 0])
+                self._fields['y'].value = np.append(nirs.probe.sourcePos3D[:, 1],
+                                                    nirs.probe.detectorPos3D[:, 1])
+                self._fields['z'].value = np.append(nirs.probe.sourcePos3D[:, 2],
+                                                    nirs.probe.detectorPos3D[:, 2])
+            elif nirs.probe.detectorPos3D is None and \
+                    nirs.probe.sourcePos3D is None:
+                self._fields['x'].value = np.append(nirs.probe.sourcePos2D[:, 0],
+                                                    nirs.probe.detectorPos2D[:, 0])
+                self._fields['y'].value = np.append(nirs.probe.sourcePos2D[:, 1],
+                                                    nirs.probe.detectorPos2D[:, 1])
+
+
+def _aux_type(name):
+    """The channels.tsv type of an aux channel, from its name: ACCEL, GYRO, MAGN or MISC"""
+    for kind in ('ACCEL', 'GYRO', 'MAGN'):
+        if kind in name:
+            return kind
+    return 'MISC'
 
 
 class Channels(TSV):
@@ -778,84 +1516,72 @@ class Channels(TSV):
     Class object that mimics and contains the data for the channels.tsv metadata file
     """
 
-    def __init__(self, fpath=None):
+    __slots__ = ()
+
+    def __init__(self, fpath=None, block=(0, 0)):
         """Inherited constructor for the Channels class
 
             Args:
-                fpath: The file path to a reference SNIRF file
+                fpath: The file path to a reference SNIRF file or a SnirfSnapshot of it
+                block: The (nirs, data) block indices to extract the metadata from
         """
         if fpath is not None:
             super().__init__()
-            self.load_from_SNIRF(fpath)
+            self.load_from_SNIRF(fpath, block)
             self._sidecar = self.make_sidecar()
         else:
             super().__init__()
 
-    def load_from_SNIRF(self, fpath):
+    def load_from_SNIRF(self, fpath, block=(0, 0)):
         """Creates the Channels class based on information from a reference SNIRF file
 
             Args:
-                fpath: The file path to the reference SNIRF file
-
-            Raises:
-                TypeError: If the dataTypeLabel is found to be invalid based on the current SNIRF specification (not a
-                string)
+                fpath: The file path to the reference SNIRF file or a SnirfSnapshot of it
+                block: The (nirs, data) block indices to extract the metadata from
         """
-        self._source_snirf = fpath
-
-        with Snirf(fpath) as s:
-            source = s.nirs[0].probe.sourceLabels
-            detector = s.nirs[0].probe.detectorLabels
-            wavelength = s.nirs[0].probe.wavelengths
-
-            name = []
-            source_list = []
-            detector_list = []
-            ctype = []
-            wavelength_nominal = np.zeros(len(s.nirs[0].data[0].measurementList))
-
-            for i in range(len(s.nirs[0].data[0].measurementList)):
-                source_index = s.nirs[0].data[0].measurementList[i].sourceIndex
-                detector_index = s.nirs[0].data[0].measurementList[i].detectorIndex
-                wavelength_index = s.nirs[0].data[0].measurementList[i].wavelengthIndex
-
-                name.append(source[source_index - 1] + '-' + detector[detector_index - 1] + '-' +
-                            str(wavelength[wavelength_index - 1]))
-
-                if s.nirs[0].data[0].measurementList[i].dataTypeLabel is None:
-                    index = s.nirs[0].data[0].measurementList[i].dataType
-                else:
-                    index = s.nirs[0].data[0].measurementList[i].dataTypeLabel
-
+        self._source_snirf = _snirf_path(fpath)
+
+        with _open_snirf(fpath) as s:
+            nirs = s.nirs[block[0]]
+            source = nirs.probe.sourceLabels
+            detector = nirs.probe.detectorLabels
+            wavelength = nirs.probe.wavelengths
+
+            ml = _read_measurement_list(nirs.data[block[1]])
+
+            # Vectorized table construction: index the probe arrays with the (1-based) measurement indices
+            source_list = _probe_entries(np.asarray(source, dtype=str), ml, 'sourceIndex')
+            detector_list = _probe_entries(np.asarray(detector, dtype=str), ml, 'detectorIndex')
+            wavelength_nominal = _probe_entries(np.asarray(wavelength, dtype=float), ml, 'wavelengthIndex')
+            name = np.char.add(np.char.add(np.char.add(np.char.add(source_list, '-'), detector_list), '-'),
+                               wavelength_nominal.astype(str))
+
+            # dataTypeLabel takes precedence over dataType; each distinct key is looked up once
+            keys = np.where(ml['dataTypeLabel'] == '', ml['dataType'].astype(str), ml['dataTypeLabel'])
+            unique_keys, inverse = np.unique(keys, return_inverse=True)
+            type_map = []
+            for key in unique_keys:
                 try:
-                    temp = _getdefault('BIDS_fNIRS_measurement_type.json', str(index))
-                except TypeError:
-                    TypeError('Invalid dataTypeLabel in measurementList' + str(i))
+                    type_map.append(_getdefault('BIDS_fNIRS_measurement_type.json', key))
                 except KeyError:
-                    temp = 'MISC'
-                ctype.append(temp)
+                    type_map.append('MISC')
+            ctype = np.array(type_map, dtype=str)[inverse]
 
-                source_list.append(source[source_index - 1])
-                detector_list.append(detector[detector_index - 1])
-                wavelength_nominal[i] = wavelength[wavelength_index - 1]
+            name = list(name)
+            ctype = list(ctype)
+            source_list = list(source_list)
+            detector_list = list(detector_list)
 
-            append_nominal = np.empty((1, len(s.nirs[0].aux)))
-            append_nominal[:] = np.NaN
+            append_nominal = np.empty((1, len(nirs.aux)))
+            append_nominal[:] = np.nan
 
-            if len(s.nirs[0].aux) > 0:
-                for j in range(len(s.nirs[0].aux)):
-                    temp = s.nirs[0].aux[j].name
+            if len(nirs.aux) > 0:
+                for j in range(len(nirs.aux)):
+                    temp = nirs.aux[j].name
                     name.append(temp)
-                    if "ACCEL" in temp:
-                        ctype.append("ACCEL")
-                    elif "GYRO" in temp:
-                        ctype.append("GYRO")
-                    elif "MAGN" in temp:
-                        ctype.append("MAGN")
-                    else:
-                        ctype.append("MISC")
-                    source_list.append("NaN")
-                    detector_list.append("NaN")
+                    ctype.append(_aux_type(temp))
+                    source_list.append("n/a")
+                    detector_list.append("n/a")
 
             self._fields['name'].value = np.array(name)
             self._fields['type'].value = np.array(ctype)
@@ -864,52 +1590,108 @@ class Channels(TSV):
             self._fields['wavelength_nominal'].value = np.append(wavelength_nominal, append_nominal)
 
 
+# Names of the extra columns of the events.tsv file
+_COLUMN_NAME = re.compile(r'[A-Za-z][A-Za-z0-9_]*\Z')
+
+
 class Events(TSV):
     """Channels Metadata Class
 
     Class object that mimics and contains the data for the events.tsv metadata file
     """
 
-    def __init__(self, fpath=None):
+    __slots__ = ()
+
+    def __init__(self, fpath=None, block=(0, 0)):
         """Inherited constructor for the Events class
 
             Args:
-                fpath: The file path to a reference SNIRF file
+                fpath: The file path to a reference SNIRF file or a SnirfSnapshot of it
+                block: The (nirs, data) block indices to extract the metadata from
         """
         if fpath is not None:
             super().__init__()
-            self.load_from_SNIRF(fpath)
+            self.load_from_SNIRF(fpath, block)
             self._sidecar = self.make_sidecar()
         else:
             super().__init__()
 
-    def load_from_SNIRF(self, fpath):
+    def load_from_SNIRF(self, fpath, block=(0, 0)):
         """Creates the Events class based on information from a reference SNIRF file
 
             Args:
-                fpath: The file path to the reference SNIRF file
+                fpath: The file path to the reference SNIRF file or a SnirfSnapshot of it
+                block: The (nirs, data) block indices to extract the metadata from
         """
-        self._source_snirf = fpath
-        temp = None
+        self._source_snirf = _snirf_path(fpath)
+
+        # Typed columns, collected per stim condition and concatenated once
+        onset = []
+        duration = []
+        value = []
+        codes = []
+        trial_types = {}  # stim name -> trial_type code, in order of appearance
+        extra = {}  # extra stim columns: name -> list of (row offset, column data) pairs
+        count = 0
+
+        with _open_snirf(fpath) as s:
+            for stim in s.nirs[block[0]].stim:
+                if stim.data is None or np.size(stim.data) == 0:
+                    continue
+                data = np.asarray(stim.data, dtype=float)
+                if data.ndim == 1:
+                    data = data.reshape(1, -1)
+                n = data.shape[0]
+
+                code = trial_types.setdefault(stim.name, len(trial_types))
+                onset.append(data[:, 0])
+                duration.append(data[:, 1] if data.shape[1] > 1 else np.full(n, np.nan))
+                value.append(data[:, 2] if data.shape[1] > 2 else np.full(n, np.nan))
+                codes.append(np.full(n, code))
+
+                labels = stim.dataLabels if stim.dataLabels is not None else []
+                for j in range(3, data.shape[1]):
+                    name = self._stim_column_name(labels[j] if j < len(labels) else None, j)
+                    extra.setdefault(name, []).append((count, data[:, j]))
+                count += n
+
+        if count == 0:
+            return
+
+        onset = np.concatenate(onset)
+        order = np.argsort(onset, kind='stable')
+        self._fields['onset'].value = onset[order]
+        self._fields['duration'].value = np.concatenate(duration)[order]
+        self._fields['value'].value = np.concatenate(value)[order]
+        self._fields['trial_type'].value = np.array(list(trial_types), dtype=str)[np.concatenate(codes)[order]]
+
+        # Extra stim columns are kept as additional (Number) columns; rows of conditions without them are NaN
+        for name, blocks in extra.items():
+            column = np.full(count, np.nan)
+            for offset, data in blocks:
+                column[offset:offset + len(data)] = data
+            self._fields[name] = Number(column[order])
+
+    def _stim_column_name(self, label, j):
+        """Names the column of an extra stim data column after its dataLabels entry
 
-        with Snirf(fpath) as s:
-            for nirs in s.nirs:
-                for stim in nirs.stim:
-                    if temp is None:
-                        temp = stim.data
-                        label = np.array([stim.name] * stim.data.shape[0])
-                        temp = np.append(temp, np.reshape(label, (-1, 1)), 1)
-                    else:
-                        new = np.append(stim.data, np.reshape(np.array([stim.name] * stim.data.shape[0]), (-1, 1)), 1)
-                        temp = np.append(temp, new, 0)
+            Args:
+                label: The dataLabels entry of the column (None if there is none)
+                j: The index of the column in the stim data
+
+            Returns:
+                The label, or stim_column_<j + 1> (with a warning) if the label is not an identifier or is the name of
+                a default field of the class or of the sidecar
+        """
 
-            temp = temp[np.argsort(temp[:, 0])]
-            self._fields['onset'].value = temp[:, 0]
-            self._fields['duration'].value = temp[:, 1]
-            self._fields['value'].value = temp[:, 2]
-            self._fields['trial_type'].value = temp[:, 3]
-            # Note: Only works with these fields for now, have to adjust for varying fields, especially those that are
-            # not specified in the BIDS documentation
+        default = 'stim_column_' + str(j + 1)
+        if label is None:
+            return default
+        label = label.decode('utf-8') if isinstance(label, bytes) else str(label)
+        if _COLUMN_NAME.match(label) is None or label in self._fields or label == 'sidecar':
+            warn('The stim data label ' + repr(label) + ' is not a valid column name, the column is named ' + default)
+            return default
+        return label
 
 
 class Sidecar(JSON):
@@ -918,39 +1700,224 @@ class Sidecar(JSON):
     Class object that mimics and contains the data for the _nirs.JSON metadata file
     """
 
-    def __init__(self, fpath=None):
+    __slots__ = ()
+
+    def __init__(self, fpath=None, block=(0, 0)):
         """Inherited constructor for the Sidecar class
 
             Args:
-                fpath: The file path to a reference SNIRF file
+                fpath: The file path to a reference SNIRF file or a SnirfSnapshot of it
+                block: The (nirs, data) block indices to extract the metadata from
         """
         if fpath is not None:
             super().__init__()
-            self.load_from_SNIRF(fpath)
+            self.load_from_SNIRF(fpath, block)
         else:
             super().__init__()
 
-    def load_from_SNIRF(self, fpath):
+    def load_from_SNIRF(self, fpath, block=(0, 0)):
         """Creates the Sidecar class based on information from a reference SNIRF file
 
+            Only scalars and dataset shapes are read: neither the time series nor the full time vector are loaded
+            (see _read_timing).
+
             Args:
-                fpath: The file path to the reference SNIRF file
+                fpath: The file path to the reference SNIRF file or a SnirfSnapshot of it
+                block: The (nirs, data) block indices to extract the metadata from
+        """
+
+        self._source_snirf = _snirf_path(fpath)
+
+        with _open_snirf(fpath) as s:
+            nirs = s.nirs[block[0]]
+            data = nirs.data[block[1]]
+            step, duration = _read_timing(data)
+            if step is not None and step > 0:
+                self._fields['SamplingFrequency'].value = 1 / step
+                self._fields['RecordingDuration'].value = duration
+            self._fields['NIRSChannelCount'].value = _measurement_count(data)
+            # the aux channels are the ACCEL, GYRO, MAGN and MISC rows of channels.tsv
+            types = [_aux_type(aux.name) for aux in nirs.aux]
+            for kind in ('ACCEL', 'GYRO', 'MAGN'):
+                if kind in types:
+                    self._fields[kind + 'ChannelCount'].value = types.count(kind)
+
+            if nirs.probe.detectorPos2D is None \
+                    and nirs.probe.sourcePos2D is None:
+                self._fields['NIRSSourceOptodeCount'].value = len(nirs.probe.sourcePos3D)
+                self._fields['NIRSDetectorOptodeCount'].value = len(nirs.probe.detectorPos3D)
+            elif nirs.probe.detectorPos3D is None \
+                    and nirs.probe.sourcePos3D is None:
+                self._fields['NIRSSourceOptodeCount'].value = len(nirs.probe.sourcePos2D)
+                self._fields['NIRSDetectorOptodeCount'].value = len(nirs.probe.detectorPos2D)
+
+
+class _LazyComponent:
+    """Descriptor for a Subject component that is extracted from the reference SNIRF file the first time it is
+    accessed, and cached afterwards
+
+    Attributes:
+        _loader: Function extracting the component from a Subject
+        _name: Name of the component attribute
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._name = None
+
+    def __set_name__(self, owner, name):
+        self._name = name
+
+    def __get__(self, subj, owner=None):
+        if subj is None:
+            return self
+        if self._name not in subj._components:
+            try:
+                with _stage('load:' + self._name, subj._snapshot):
+                    subj._components[self._name] = self._loader(subj)
+            finally:
+                if subj._lazy:
+                    subj.close()
+        return subj._components[self._name]
+
+    def __set__(self, subj, value):
+        subj._components[self._name] = value
+
+
+def _load_participants(subj):
+    """Extracts the participants.tsv row of a Subject from its reference SNIRF file"""
+    fpath = subj._snapshot
+    block = subj._block
+    return {
+        # REQUIRED BY SNIRF SPECIFICATION #
+        'participant_id': 'sub-' + subj.get_subj(),
+
+        # RECOMMENDED BY BIDS #
+        'species': _pull_participant('species', fpath=fpath, block=block),  # default Homo sapiens based on BIDS
+        'age': _pull_participant('age', fpath=fpath, block=block),
+        'sex': _pull_participant('sex', fpath=fpath, block=block),  # 1 is male, 2 is female
+        'handedness': _pull_participant('handedness', fpath=fpath, block=block),
+        'strain': _pull_participant('strain', fpath=fpath, block=block),
+        'strain_rrid': _pull_participant('strain_rrid', fpath=fpath, block=block)
+    }
+
+
+def _load_scans(subj):
+    """Extracts the scans.tsv row of a Subject from its reference SNIRF file"""
+    return {
+        'filename': _pull_scans(subj.subinfo, 'filename', fpath=subj._snapshot, block=subj._block),
+        'acq_time': _pull_scans(subj.subinfo, 'acq_time', fpath=subj._snapshot, block=subj._block)
+    }
+
+
+class ExportWriter:
+    """Bounded thread pool that writes the metadata files of 'Subject' objects in the background
+
+    Subject.export('Folder', fpath, writer=writer) queues one write per metadata file and returns immediately, so that
+    on high-latency file systems (NFS) the file creation round-trips overlap each other and the extraction of the next
+    Subject. At most max_pending writes are queued at a time; export blocks when the queue is full.
+
+    Every write is reported once it completes, as a (file path, error) pair where error is None on success.
+
+    Attributes:
+        results: The list of (file path, error) pairs of the completed writes, in completion order
+    """
+
+    def __init__(self, max_workers=8, max_pending=64, callback=None):
+        """Constructor for the ExportWriter class
+
+        Args:
+            max_workers: The number of writer threads
+            max_pending: The maximum number of queued (not yet completed) writes
+            callback: Optional function called as callback(fpath, error) from the writer thread after every write
+        """
+
+        self.results = []
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='snirf2bids-export')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._callback = callback
+        self._lock = threading.Lock()
+        self._futures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, fpath, write):
+        """Queues a single file write
+
+            Args:
+                fpath: The path of the file written (used to report the write)
+                write: A function without arguments that writes the file
+
+            Returns:
+                The concurrent.futures.Future of the write
+        """
+
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(write)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda done: self._done(fpath, done))
+        with self._lock:
+            self._futures.append(future)
+        return future
+
+    def _done(self, fpath, future):
+        """Records a completed write and frees its queue slot"""
+        self._slots.release()
+        error = future.exception()
+        with self._lock:
+            self.results.append((fpath, error))
+        if self._callback is not None:
+            self._callback(fpath, error)
+
+    def wait(self):
+        """Waits for every queued write to complete
+
+            Returns:
+                The list of (file path, error) pairs of the completed writes
+        """
+
+        with self._lock:
+            futures = list(self._futures)
+        wait(futures)
+        with self._lock:
+            self._futures = [future for future in self._futures if not future.done()]
+            return list(self.results)
+
+    def failed(self):
+        """Lists the writes that raised an error
+
+            Returns:
+                The list of (file path, error) pairs of the failed writes completed so far
+        """
+
+        with self._lock:
+            return [(fpath, error) for fpath, error in self.results if error is not None]
+
+    def close(self):
+        """Waits for every queued write to complete and stops the writer threads
+
+            Returns:
+                The list of (file path, error) pairs of the completed writes
         """
 
-        self._source_snirf = fpath
+        results = self.wait()
+        self._pool.shutdown(wait=True)
+        return results
 
-        with Snirf(fpath) as s:
-            self._fields['SamplingFrequency'].value = np.mean(np.diff(np.array(s.nirs[0].data[0].time)))
-            self._fields['NIRSChannelCount'].value = len(s.nirs[0].data[0].measurementList)
 
-            if s.nirs[0].probe.detectorPos2D is None \
-                    and s.nirs[0].probe.sourcePos2D is None:
-                self._fields['NIRSSourceOptodeCount'].value = len(s.nirs[0].probe.sourcePos3D)
-                self._fields['NIRSDetectorOptodeCount'].value = len(s.nirs[0].probe.detectorPos3D)
-            elif s.nirs[0].probe.detectorPos3D is None \
-                    and s.nirs[0].probe.sourcePos3D is None:
-                self._fields['NIRSSourceOptodeCount'].value = len(s.nirs[0].probe.sourcePos2D)
-                self._fields['NIRSDetectorOptodeCount'].value = len(s.nirs[0].probe.detectorPos2D)
+def _raise_failed(writer):
+    """Raises the first error of an ExportWriter, if any of its writes failed"""
+    failed = writer.failed()
+    if failed:
+        fpath, error = failed[0]
+        raise error
 
 
 class Subject(object):
@@ -959,6 +1926,10 @@ class Subject(object):
     Class object that encapsulates a single 'run' (for now) with fields containing the metadata and
     'subject'/run information
 
+    The subject/run information is parsed from the file name when the object is created. The other components are
+    extracted from the reference SNIRF file either all at once, when the object is created, or (with lazy=True) each
+    the first time it is accessed.
+
     Attributes:
         coordsystem: Contains a Coordsystem class object for a specific 'subject'/run
         optodes: Contains an Optodes class object for a specific 'subject'/run
@@ -967,54 +1938,58 @@ class Subject(object):
         events: Contains an Events class object for a specific 'subject'/run
         subinfo: Contains the 'subject'/run information related to the data stored in a 'Subject' object
         participants: Contains the metadata related to the participants.tsv file
+        scans: Contains the metadata related to the scans.tsv file
 
     """
 
-    def __init__(self, fpath=None):
-        """Constructor for the 'Subject' class"""
-
-        self.coordsystem = Coordsystem(fpath=fpath)
-        self.optodes = Optodes(fpath=fpath)
-        self.channel = Channels(fpath=fpath)
-        self.sidecar = Sidecar(fpath=fpath)
-        self.events = Events(fpath=fpath)
-        self.subinfo = {
-            'sub-': _pull_label(fpath, 'sub-'),
-            'ses-': _pull_label(fpath, 'ses-'),
-            'task-': self.pull_task(fpath),
-            'run-': _pull_label(fpath, 'run-')
-        }
-        self.participants = {
-            # REQUIRED BY SNIRF SPECIFICATION #
-            'participant_id': 'sub-' + self.get_subj(),
-
-            # RECOMMENDED BY BIDS #
-            'species': _pull_participant('species', fpath=fpath),  # default Homo sapiens based on BIDS
-            'age': _pull_participant('age', fpath=fpath),
-            'sex': _pull_participant('sex', fpath=fpath),  # 1 is male, 2 is female
-            'handedness': _pull_participant('handedness', fpath=fpath),
-            'strain': _pull_participant('strain', fpath=fpath),
-            'strain_rrid': _pull_participant('strain_rrid', fpath=fpath)
-        }
-        self.scans = {
-            'filename': _pull_scans(self.subinfo, 'filename', fpath=fpath),
-            'acq_time': _pull_scans(self.subinfo, 'acq_time', fpath=fpath)
-        }
-
-    def pull_task(self, fpath=None):
-        """Pull the Task label from either the SNIRF file name or from the Sidecar class (if available)
+    components = ('coordsystem', 'optodes', 'channel', 'sidecar', 'events', 'participants', 'scans')
 
-            Args:
-                fpath: The file path to the reference SNIRF file
+    coordsystem = _LazyComponent(lambda subj: Coordsystem(fpath=subj._snapshot, block=subj._block))
+    optodes = _LazyComponent(lambda subj: Optodes(fpath=subj._snapshot, block=subj._block))
+    channel = _LazyComponent(lambda subj: Channels(fpath=subj._snapshot, block=subj._block))
+    sidecar = _LazyComponent(lambda subj: Sidecar(fpath=subj._snapshot, block=subj._block))
+    events = _LazyComponent(lambda subj: Events(fpath=subj._snapshot, block=subj._block))
+    participants = _LazyComponent(_load_participants)
+    scans = _LazyComponent(_load_scans)
 
-            Returns:
-                The task label/name
+    def __init__(self, fpath=None, lazy=False, block=(0, 0), run=None):
+        """Constructor for the 'Subject' class
+
+            Args:
+                fpath: The file path to the reference SNIRF file or a SnirfSnapshot of it. A file path is opened
+                    once and shared by all the metadata classes
+                lazy: Extract each component the first time it is accessed instead of in the constructor. The SNIRF
+                    file is only held open while a component is being extracted
+                block: The (nirs, data) block indices of the run in the SNIRF file
+                run: The run label, overriding the one in the file name (see subjects_from_snirf)
         """
 
-        if self.sidecar.TaskName is None:
-            return _pull_label(fpath, 'task-')
-        else:
-            return self.sidecar.TaskName
+        self._snapshot = SnirfSnapshot(fpath) if isinstance(fpath, str) else fpath
+        self._owns_snapshot = isinstance(fpath, str)
+        self._components = {}
+        self._lazy = lazy
+        self._block = tuple(block)
+        self.subinfo = _subject_labels(fpath) if fpath is not None else dict.fromkeys(('sub-', 'ses-', 'task-', 'run-'))
+        if run is not None:
+            self.subinfo['run-'] = str(run)
+
+        if not lazy:
+            try:
+                for name in self.components:
+                    getattr(self, name)
+            finally:
+                self.close()
+
+    def close(self):
+        """Closes the reference SNIRF file if it was opened by this object (it is reopened if a component that has
+        not been extracted yet is accessed)"""
+        if self._owns_snapshot:
+            self._snapshot.close()
+
+    @property
+    def filenames(self):
+        """The table of every BIDS file name of this 'subject'/run (see _filename_table)"""
+        return _filename_table(self.subinfo)
 
     def pull_fnames(self):
         """Check directory for files (not folders)
@@ -1028,36 +2003,21 @@ class Subject(object):
 
         Notes:
             Have to figure out how to do this based on the database structure
-            In the case of the test snirf file, there is no presence of:
-                1. session number
-                2. run number
+            The run label (if any) only changes the file names, not the split
        """
-        subj_fnames = None
-        ses_fnames = None
-        # Case of No SESSION OR RUN NUMBER
-        if self.subinfo['ses-'] is None and self.subinfo['run-'] is None:
+        fnames = self.filenames
+        # Case of No SESSION NUMBER
+        if self.subinfo['ses-'] is None:
             fields = ['optodes', 'coordsystem', 'sidecar', 'events', 'channel']
-            subj_fnames = {field: None for field in fields}
-            keylist = list(subj_fnames.keys())
-            for key in keylist:
-                subj_fnames[key] = _make_filename(key, self.subinfo)
-
+            subj_fnames = {key: fnames[(_FNAME_CLASSES.get(key, key), None)] for key in fields}
             ses_fnames = None
 
         # CASE OF SESSION EXISTING
-        if self.subinfo['ses-'] is not None and self.subinfo['run-'] is None:
+        else:
             subj_fields = ['optodes', 'coordsystem']
             ses_fields = ['sidecar', 'events', 'channel']
-
-            subj_fnames = {field: None for field in subj_fields}
-            keylist = list(subj_fnames.keys())
-            for key in keylist:
-                subj_fnames[key] = _make_filename(key, self.subinfo)
-
-            ses_fnames = {field: None for field in ses_fields}
-            keylist = list(ses_fnames.keys())
-            for key in keylist:
-                ses_fnames[key] = _make_filename(key, self.subinfo)
+            subj_fnames = {key: fnames[(_FNAME_CLASSES.get(key, key), None)] for key in subj_fields}
+            ses_fnames = {key: fnames[(_FNAME_CLASSES.get(key, key), None)] for key in ses_fields}
 
         return subj_fnames, ses_fnames
 
@@ -1065,13 +2025,20 @@ class Subject(object):
         """Loads the metadata from a reference SNIRF file
 
             Args:
-                fpath: The file path to the reference SNIRF file
+                fpath: The file path to the reference SNIRF file or a SnirfSnapshot of it
         """
 
-        self.coordsystem.load_from_SNIRF(fpath)
-        self.optodes.load_from_SNIRF(fpath)
-        self.channel.load_from_SNIRF(fpath)
-        self.sidecar.load_from_SNIRF(fpath)
+        snapshot = SnirfSnapshot(fpath) if isinstance(fpath, str) else fpath
+        try:
+            for name, cls in [('coordsystem', Coordsystem), ('optodes', Optodes), ('channel', Channels),
+                              ('sidecar', Sidecar)]:
+                # load into the existing object, without extracting it from the previous reference file first
+                component = self._components.get(name, None) or cls()
+                component.load_from_SNIRF(snapshot, self._block)
+                setattr(self, name, component)
+        finally:
+            if snapshot is not fpath:
+                snapshot.close()
 
     def get_subj(self):
         """Obtains the subject ID/number for a particular 'subject'/run
@@ -1097,7 +2064,40 @@ class Subject(object):
             # Pull out the sessions here with a function
             return self.subinfo['ses-']
 
-    def export(self, outputFormat: str = 'Folder', fpath: str = None):
+    def _export_jobs(self, fpath, session=True):
+        """Lists the metadata file writes of export('Folder')
+
+            The components are extracted here (in the calling thread), so the writes themselves never touch the
+            SNIRF file.
+
+            Args:
+                fpath: The file path that points to the folder where we intend to save the metadata files in
+                session: Also write the session-level files (_optodes.tsv, _optodes.json and _coordsystem.json)
+
+            Returns:
+                A list of (file path, write function) pairs, in export order
+        """
+
+        info = self.subinfo
+        jobs = []
+        for name, method in (('coordsystem', 'save_to_json'), ('optodes', 'save_to_tsv'),
+                             ('optodes', 'export_sidecar'), ('channel', 'save_to_tsv'),
+                             ('channel', 'export_sidecar'), ('sidecar', 'save_to_json'),
+                             ('events', 'save_to_tsv'), ('events', 'export_sidecar')):
+            if not session and name in _SESSION_COMPONENTS:
+                continue
+            component = getattr(self, name)
+            classname = component.get_class_name().lower()
+            filedir = _makefiledir(info, classname, fpath, 'sidecar' if method == 'export_sidecar' else None)
+            jobs.append((filedir, partial(self._write, getattr(component, method), fpath)))
+        return jobs
+
+    def _write(self, write, fpath):
+        """Runs a metadata file write of export('Folder') as an 'export' stage, in the calling (writer) thread"""
+        with _stage('export', self._snapshot):
+            write(self.subinfo, fpath)
+
+    def export(self, outputFormat: str = 'Folder', fpath: str = None, writer=None, session=True):
         """Exports/creates the BIDS-compliant metadata files based on information stored in the 'subject' class object
 
             Args:
@@ -1106,21 +2106,23 @@ class Subject(object):
                     specified by the user
                     The other option is 'Text', which outputs the files and data as a string (JSON-like format)
                 fpath: The file path that points to the folder where we intend to save the metadata files in
+                writer: Optional ExportWriter. With the 'Folder' output format, the files are then queued on the writer
+                    instead of being written before export returns
+                session: Also write the session-level files (_optodes.tsv, _optodes.json and _coordsystem.json), which
+                    the runs of a session share (see _claim_session)
 
             Returns:
                 A string containing the metadata file names and its content if the user chose the 'Text' output format
                 or a set of metadata files in a specified folder if the user chose the default or 'Folder' output format
+                (the list of the concurrent.futures.Future of the writes when a writer is given)
         """
 
         if outputFormat == 'Folder':
-            self.coordsystem.save_to_json(self.subinfo, fpath)
-            self.optodes.save_to_tsv(self.subinfo, fpath)
-            self.optodes.export_sidecar(self.subinfo, fpath)
-            self.channel.save_to_tsv(self.subinfo, fpath)
-            self.channel.export_sidecar(self.subinfo, fpath)
-            self.sidecar.save_to_json(self.subinfo, fpath)
-            self.events.save_to_tsv(self.subinfo, fpath)
-            self.events.export_sidecar(self.subinfo, fpath)
+            jobs = self._export_jobs(fpath, session)
+            if writer is not None:
+                return [writer.submit(filedir, write) for filedir, write in jobs]
+            for filedir, write in jobs:
+                write()
             return 0
         else:
             subj = {}
@@ -1135,39 +2137,1712 @@ class Subject(object):
                 return 0
 
 
-def snirf_to_bids(inputpath: str, outputpath: str, participants: dict = None):
-    """Creates a BIDS-compliant folder structure (right now, just the metadata files) from a SNIRF file
+# Subject components written to the session-level files, shared by every run of a session
+_SESSION_COMPONENTS = ('coordsystem', 'optodes')
+
+
+def _same_value(a, b):
+    """Whether two field values (scalars, strings or arrays, NaN equal to NaN) are equal"""
+    if a is None or b is None:
+        return a is b
+    a = np.asarray(a)
+    b = np.asarray(b)
+    if a.shape != b.shape:
+        return False
+    if a.dtype.kind == 'f' and b.dtype.kind == 'f':
+        return bool(np.array_equal(a, b, equal_nan=True))
+    return bool(np.array_equal(a, b))
+
+
+def _claim_session(sessions, subj, outputpath):
+    """Records the session-level files of a run and tells whether the run is the first of its session to write them
 
         Args:
-            inputpath: The file path to the reference SNIRF file
-            outputpath: The file path/directory for the created BIDS metadata files
-            participants: A dictionary with participant information
-                Example =
-                    {participant_id: 'sub-01',
-                     age: 34,
-                     sex: 'M'}
+            sessions: A dictionary of the runs already exported, keyed by session-level file path; updated in place
+            subj: The Subject class object (run)
+            outputpath: The folder the metadata files of the run are written in
+
+        Returns:
+            True if the run writes the session-level files, False if an earlier run with the same files does
+
+        Raises:
+            ValueError: If an earlier run of the same session has different optodes or coordinate system fields
     """
 
-    subj = Subject(inputpath)
-    subj.export('Folder', outputpath)
-    _compliancy_check(subj)
-    fname = outputpath + '/participants.tsv'
+    key = os.path.join(outputpath, subj.filenames[('optodes', None)])
+    first = sessions.setdefault(key, subj)
+    if first is subj:
+        return True
+    for name in _SESSION_COMPONENTS:
+        a = getattr(first, name)._fields
+        b = getattr(subj, name)._fields
+        names = {field for field in list(a) + list(b) if field != 'path2origin'}
+        if not all(_same_value(a[field].value if field in a else None, b[field].value if field in b else None)
+                   for field in names):
+            raise ValueError('The runs ' + first.filenames[('scans', 'init')] + ' and ' +
+                             subj.filenames[('scans', 'init')] + ' share the ' + name + ' files of their session but '
+                             'their ' + name + ' differ')
+    return False
+
+
+def _snirf_blocks(fpath):
+    """Lists the data blocks of a SNIRF file
 
-    # This will probably work only with a single SNIRF file for now
-    with open(fname, 'w', newline='') as f:
-        if participants is None:
-            writer = csv.DictWriter(f, fieldnames=list(subj.participants.keys()), delimiter="\t", quotechar='"')
-            writer.writeheader()
-            writer.writerow({'participant_id': 'sub-' + subj.get_subj()})
+        Args:
+            fpath: The file path to the reference SNIRF file or a SnirfSnapshot of it
+
+        Returns:
+            The list of (nirs, data) block indices, in file order
+    """
+
+    with _open_snirf(fpath) as s:
+        return [(i, j) for i in range(len(s.nirs)) for j in range(len(s.nirs[i].data))]
+
+
+def _block_runs(fpath, count):
+    """Numbers the data blocks of a SNIRF file as consecutive runs
+
+        The runs start from the run label of the file name (or 1) and keep its zero padding (run-01 gives 01, 02, ...).
+
+        Args:
+            fpath: The file path to the reference SNIRF file
+            count: The number of data blocks
+
+        Returns:
+            The list of run labels, in block order
+
+        Raises:
+            ValueError: If the run label of the file name is not a number, or if another SNIRF file in the same folder
+                has the same labels as one of the runs
+    """
+
+    labels = _subject_labels(fpath)
+    label = labels['run-']
+    if label is not None and not label.isdigit():
+        raise ValueError('The data blocks of ' + fpath + ' cannot be numbered as runs from the run label ' + label)
+    first = int(label) if label is not None else 1
+    width = len(label) if label is not None else 1
+    runs = [str(first + k).zfill(width) for k in range(count)]
+
+    # the runs must not take the place of the other SNIRF files of the session
+    others = {key: value for key, value in labels.items() if key != 'run-'}
+    for sibling in glob.glob(os.path.join(os.path.dirname(fpath), '*.snirf')):
+        if os.path.abspath(sibling) == os.path.abspath(fpath):
+            continue
+        try:
+            sibling_labels = _subject_labels(sibling)
+        except ValueError:
+            continue
+        run = sibling_labels.pop('run-')
+        if run is not None and run.isdigit() and int(run) in (first + k for k in range(count)) and \
+                sibling_labels == others:
+            raise ValueError('The data blocks of ' + fpath + ' are numbered as runs ' + runs[0] + ' to ' + runs[-1] +
+                             ', but run ' + run + ' is ' + sibling)
+    return runs
+
+
+def subjects_from_snirf(fpath, lazy=False):
+    """Creates one 'Subject' (BIDS run) for every /nirs{i}/data{j} block of a SNIRF file
+
+        A file with a single data block gives a single Subject, with the run label of the file name. When there are
+        several blocks, they are numbered as consecutive runs (see _block_runs).
+
+        Args:
+            fpath: The file path to the reference SNIRF file
+            lazy: Create lazy Subjects (see Subject)
+
+        Returns:
+            The list of Subjects, in block order
+    """
+
+    snapshot = SnirfSnapshot(fpath)
+    try:
+        blocks = _snirf_blocks(snapshot)
+        if len(blocks) <= 1:
+            runs = [None]
+            blocks = [(0, 0)]
         else:
-            writer = csv.DictWriter(f, fieldnames=list(participants.keys()), delimiter="\t", quotechar='"')
-            writer.writeheader()
-            writer.writerow(participants)
+            runs = _block_runs(fpath, len(blocks))
 
-    # scans.tsv output
-    # same thing as participants for scans
-    fname = outputpath + '/scans.tsv'
-    with open(fname, 'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=list(subj.scans.keys()), delimiter="\t", quotechar='"')
-        writer.writeheader()
-        writer.writerow({'filename': subj.scans['filename'], 'acq_time': subj.scans['acq_time']})
+        # eager Subjects share the open file; lazy ones reopen it on demand
+        source = fpath if lazy else snapshot
+        return [Subject(source, lazy=lazy, block=block, run=run) for block, run in zip(blocks, runs)]
+    finally:
+        snapshot.close()
+
+
+_STAGING_PREFIX = '.snirf2bids-staging-'
+
+
+@contextmanager
+def _staged_output(outputpath):
+    """Stages output files and moves them into place only if the whole block succeeds
+
+        The files are written to a staging directory inside outputpath (so on the same file system) and, once the block
+        completes, moved to the same relative path under outputpath with atomic renames (see _commit_staging). If the
+        block raises, the staging directory is removed and outputpath is left untouched.
+
+        Args:
+            outputpath: The destination directory
+
+        Yields:
+            The path to the staging directory
+    """
+
+    os.makedirs(outputpath, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=_STAGING_PREFIX, dir=outputpath)
+    try:
+        yield staging
+        _commit_staging(staging, outputpath)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def _commit_staging(staging, outputpath):
+    """Moves every file of a staging directory to the same relative path under outputpath, all or nothing
+
+        A file already at a destination path is first moved aside (into the staging directory). If a move fails, the
+        moves already done are undone and the files moved aside are put back before the error is raised, so outputpath
+        ends up with either every staged file or none of them.
+
+        Args:
+            staging: The path to the staging directory
+            outputpath: The destination directory
+    """
+
+    files = []
+    for dirpath, dirnames, filenames in os.walk(staging):
+        files += [os.path.join(os.path.relpath(dirpath, staging), filename) for filename in sorted(filenames)]
+    backup = tempfile.mkdtemp(prefix='replaced-', dir=staging)
+
+    done = []
+    try:
+        for k, fname in enumerate(files):
+            target = os.path.join(outputpath, fname)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            replaced = None
+            if os.path.lexists(target):
+                replaced = os.path.join(backup, str(k))
+                os.replace(target, replaced)
+            done.append((fname, replaced))
+            os.replace(os.path.join(staging, fname), target)
+    except BaseException:
+        for fname, replaced in reversed(done):
+            target = os.path.join(outputpath, fname)
+            try:
+                if not os.path.lexists(os.path.join(staging, fname)):
+                    os.replace(target, os.path.join(staging, fname))
+                if replaced is not None:
+                    os.replace(replaced, target)
+            except OSError as e:
+                warn('Cannot restore ' + target + ' (' + str(e) + ')')
+        raise
+
+
+def _unstage(subj, staging, outputpath):
+    """Points the path2origin of the JSON components of a 'Subject' from the staging directory to the destination
+
+        Args:
+            subj: The Subject class object
+            staging: The path to the staging directory the files were written in
+            outputpath: The destination directory
+    """
+
+    for name in ('coordsystem', 'sidecar'):
+        field = getattr(subj, name)._fields['path2origin']
+        if field.value is not None and field.value.startswith(staging):
+            field.value = outputpath + field.value[len(staging):]
+
+
+# Ways of placing the SNIRF data file into the BIDS tree (see place_snirf)
+DATA_MODES = ('hardlink', 'reflink', 'symlink', 'copy')
+_FICLONE = 0x40049409  # Linux ioctl sharing the extents of a file (reflink) on btrfs, XFS, ...
+_COPY_CHUNK = 1 << 20
+
+
+def _copy_stream(src, dst):
+    """Copies a file in chunks, hashing the content on the way
+
+        Returns:
+            The SHA-256 hash of the file (hex string)
+    """
+
+    digest = hashlib.sha256()
+    with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+        for chunk in iter(lambda: fin.read(_COPY_CHUNK), b''):
+            digest.update(chunk)
+            fout.write(chunk)
+    return digest.hexdigest()
+
+
+def _copy_reflink(src, dst):
+    """Copies a file without moving its content through Python
+
+        The copy is a reflink (shared extents, no data written) where the file system supports it, then an in-kernel
+        os.copy_file_range copy (server-side on NFS 4.2), then a plain chunked copy.
+    """
+
+    with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(fout.fileno(), _FICLONE, fin.fileno())
+                return
+            except OSError:
+                pass
+        if hasattr(os, 'copy_file_range'):
+            try:
+                remaining = os.fstat(fin.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fin.fileno(), fout.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                if remaining == 0:
+                    return
+            except OSError:
+                pass
+        fin.seek(0)
+        fout.seek(0)
+        fout.truncate()
+        shutil.copyfileobj(fin, fout, _COPY_CHUNK)
+
+
+def _check_data_mode(mode):
+    """Raises a ValueError if mode is not one of DATA_MODES"""
+    if mode not in DATA_MODES:
+        raise ValueError('Unknown data mode ' + repr(mode) + ', expected one of ' + ', '.join(DATA_MODES))
+
+
+def _place_file(src, dst, mode):
+    """Places a file at a new path
+
+        Args:
+            src: The file path to the source file
+            dst: The destination file path (must not exist)
+            mode: 'hardlink', 'reflink', 'symlink' (absolute link) or 'copy' (streamed copy with checksum). A hard
+                link that is not possible (other file system) falls back to a copy
+
+        Returns:
+            The SHA-256 hash of the file for a copy, None otherwise
+
+        Raises:
+            ValueError: If the mode is unknown
+    """
+
+    _check_data_mode(mode)
+    if mode == 'hardlink':
+        try:
+            os.link(src, dst)
+            return None
+        except OSError as e:
+            warn('Cannot hard-link ' + src + ' (' + str(e) + '), copying it instead')
+            mode = 'copy'
+    if mode == 'symlink':
+        os.symlink(os.path.abspath(src), dst)
+        return None
+    if mode == 'reflink':
+        _copy_reflink(src, dst)
+        return None
+    return _copy_stream(src, dst)
+
+
+def _extract_block(src, dst, nirs_name, data_name):
+    """Writes a single /nirs{i}/data{j} block of a SNIRF file as a SNIRF file of its own
+
+        Every other group and dataset of the /nirs{i} group (probe, stims, aux, ...) and of the file root is copied
+        as is; the data block becomes /nirs/data1.
+
+        Args:
+            src: The file path to the source SNIRF file
+            dst: The destination file path
+            nirs_name: The HDF5 name of the /nirs{i} group
+            data_name: The HDF5 name of the data{j} group
+    """
+
+    with h5py.File(src, 'r') as fin, h5py.File(dst, 'w') as fout:
+        for key, value in fin.attrs.items():
+            fout.attrs[key] = value
+        for name in fin:
+            if not (name == 'nirs' or name.startswith('nirs') and name[4:].isdigit()):
+                fin.copy(fin[name], fout, name=name)
+        nirs = fout.create_group('nirs')
+        for key, value in fin[nirs_name].attrs.items():
+            nirs.attrs[key] = value
+        for name in fin[nirs_name]:
+            if name == data_name:
+                fin.copy(fin[nirs_name][name], nirs, name='data1')
+            elif not (name.startswith('data') and name[4:].isdigit()):
+                fin.copy(fin[nirs_name][name], nirs, name=name)
+
+
+def _place_data(inputpath, subjs, folders, mode):
+    """Places the SNIRF data file of every run at the path of its scans.tsv row
+
+        A file with a single data block is placed as a whole (see _place_file). For a file with several data blocks,
+        every run gets a new SNIRF file with its own block only (see _extract_block).
+
+        Args:
+            inputpath: The file path to the reference SNIRF file
+            subjs: The Subject class objects (runs) of the SNIRF file
+            folders: For every run, the folder of its scans.tsv file
+            mode: See _place_file
+
+        Returns:
+            A dictionary of the SHA-256 hashes (None when not computed), keyed by the placed file paths
+    """
+
+    placed = {}
+    with _stage('data', inputpath):
+        names = None
+        if len(subjs) > 1:
+            with _open_snirf(inputpath) as s:
+                names = [(s.nirs[i]._h.name, s.nirs[i].data[j]._h.name.rsplit('/', 1)[-1])
+                         for i, j in (subj._block for subj in subjs)]
+        for k, (subj, folder) in enumerate(zip(subjs, folders)):
+            dst = os.path.join(folder, 'nirs', _make_filename('nirs', subj.subinfo))
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if names is None:
+                placed[dst] = _place_file(inputpath, dst, mode)
+            else:
+                _extract_block(inputpath, dst, *names[k])
+                placed[dst] = _fingerprint(dst, checksum=True)['sha256'] if mode == 'copy' else None
+    return placed
+
+
+def place_snirf(inputpath: str, output_root: str, mode: str = 'copy'):
+    """Places the SNIRF data file into the sub-<label>/[ses-<label>/]nirs/ folder of a BIDS dataset
+
+        The file is named after its scans.tsv row (sub-<label>[_ses-<label>]_task-<label>[_run-<label>]_nirs.snirf).
+        Every /nirs{i}/data{j} block of a file with several blocks is written as a SNIRF file of its own, one per run.
+        The file is staged and moved into place atomically.
+
+        Args:
+            inputpath: The file path to the reference SNIRF file
+            output_root: The root directory of the BIDS dataset
+            mode: 'hardlink' (no copy; same file system only, otherwise falls back to 'copy'), 'reflink' (shared
+                extents or in-kernel copy where supported), 'symlink' (absolute link to inputpath) or 'copy' (streamed
+                copy with SHA-256 checksum)
+
+        Returns:
+            A dictionary of the SHA-256 hashes of the placed files ('copy' mode, None otherwise), keyed by file path
+            relative to output_root
+    """
+
+    subjs = subjects_from_snirf(inputpath, lazy=True)
+    with _staged_output(output_root) as staging:
+        placed = _place_data(inputpath, subjs, [os.path.join(staging, _make_subjdir(subj.subinfo)) for subj in subjs],
+                             mode)
+    return {os.path.relpath(dst, staging).replace(os.sep, '/'): sha256 for dst, sha256 in placed.items()}
+
+
+_JOURNAL = '.snirf2bids_tables.journal'
+
+
+class DatasetTables:
+    """participants.tsv and scans.tsv aggregator of a BIDS dataset
+
+    Keeps the participants rows keyed by participant_id and the scans rows keyed by scans.tsv file and filename, so
+    that converting many SNIRF files upserts rows in memory and writes each table once, with flush, instead of
+    rewriting the files after every conversion. The scans rows of a run go to sub-<label>/[ses-<label>/]
+    sub-<label>[_ses-<label>]_scans.tsv (or to a single scans.tsv at the root with flat=True, the snirf_to_bids
+    layout).
+
+    With journal=True every upsert is also appended to a journal file at the root of the dataset, so that rows that
+    were not flushed yet are recovered by the next DatasetTables of the same dataset; flush then removes the journal
+    (a DatasetTables without journal never removes it).
+
+    Attributes:
+        output_root: The root directory of the BIDS dataset
+        participants: The participants rows, keyed by participant_id
+        scans: The scans rows, keyed by scans.tsv path (relative to output_root) and then by filename
+        flat: Whether every scans row goes to output_root/scans.tsv
+    """
+
+    def __init__(self, output_root, load=True, flat=False, journal=False, flush_every=None):
+        """Constructor for the DatasetTables class
+
+        Args:
+            output_root: The root directory of the BIDS dataset
+            load: Start from the rows of the existing participants.tsv and scans.tsv files (and journal)
+            flat: Write every scans row to output_root/scans.tsv instead of the per-subject/session files
+            journal: Append every upsert to a journal file until the next flush
+            flush_every: Flush after this many upserts (default: only when flush is called)
+        """
+
+        self.output_root = output_root
+        self.participants = {}
+        self.scans = {}
+        self.flat = flat
+        self._journal = os.path.join(output_root, _JOURNAL) if journal else None
+        self._flush_every = flush_every
+        self._pending = 0
+        self._dirty = set()
+
+        if load:
+            self._load()
+
+    def _scans_path(self, subinfo):
+        """The path (relative to output_root) of the scans.tsv file of a run"""
+        if self.flat:
+            return 'scans.tsv'
+        return _make_subjdir(subinfo) + '/' + _make_filename('scans', subinfo)
+
+    def _load(self):
+        """Loads the existing tables and replays the journal"""
+        fname = os.path.join(self.output_root, 'participants.tsv')
+        if os.path.isfile(fname):
+            for row in self._read_rows(fname):
+                self.participants[row['participant_id']] = row
+
+        scans = ['scans.tsv'] if self.flat else [
+            os.path.relpath(path, self.output_root).replace(os.sep, '/')
+            for pattern in ('sub-*/sub-*_scans.tsv', 'sub-*/ses-*/sub-*_scans.tsv')
+            for path in sorted(glob.glob(os.path.join(self.output_root, pattern)))]
+        for path in scans:
+            fname = os.path.join(self.output_root, path)
+            if os.path.isfile(fname):
+                self.scans[path] = {row['filename']: row for row in self._read_rows(fname)}
+
+        journal = os.path.join(self.output_root, _JOURNAL)
+        if os.path.isfile(journal):
+            with open(journal) as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:  # a write interrupted mid-line
+                        continue
+                    if entry['table'] == 'participants':
+                        self._upsert_participant(entry['row'])
+                    else:
+                        self._upsert_scan(entry['table'], entry['row'])
+
+    @staticmethod
+    def _read_rows(fname):
+        """Reads the rows of a TSV file as dictionaries (None for 'n/a')"""
+        names, columns = _read_tsv_columns(fname)
+        return [{name: None if cell == 'n/a' else cell for name, cell in zip(names, cells)}
+                for cells in zip(*columns)]
+
+    def _upsert_participant(self, row):
+        current = self.participants.setdefault(row['participant_id'], {})
+        current.update({key: value for key, value in row.items() if value is not None or key not in current})
+        self._dirty.add('participants.tsv')
+
+    def _upsert_scan(self, path, row):
+        current = self.scans.setdefault(path, {}).setdefault(row['filename'], {})
+        current.update({key: value for key, value in row.items() if value is not None or key not in current})
+        self._dirty.add(path)
+
+    def _log(self, table, row):
+        """Appends an upsert to the journal and flushes every flush_every upserts"""
+        if self._journal is not None:
+            with open(self._journal, 'a') as file:
+                file.write(json.dumps({'table': table, 'row': row}) + '\n')
+        self._pending += 1
+        if self._flush_every is not None and self._pending >= self._flush_every:
+            self.flush()
+
+    def upsert_participant(self, row):
+        """Inserts or updates a participants row (values that are None do not overwrite existing values)
+
+            Args:
+                row: The row, a dictionary with at least a participant_id
+        """
+
+        self._upsert_participant(row)
+        self._log('participants', row)
+
+    def upsert_scan(self, subinfo, row):
+        """Inserts or updates the scans row of a run (values that are None do not overwrite existing values)
+
+            Args:
+                subinfo: The subject info of the run (see Subject.subinfo)
+                row: The row, a dictionary with at least a filename
+        """
+
+        path = self._scans_path(subinfo)
+        self._upsert_scan(path, row)
+        self._log(path, row)
+
+    def has_scan(self, subinfo, filename):
+        """Whether the scans.tsv file of a run has a row for a file
+
+            Args:
+                subinfo: The subject info of the run (see Subject.subinfo)
+                filename: The filename of the row
+        """
+        return filename in self.scans.get(self._scans_path(subinfo), {})
+
+    def add(self, subj, participant=None):
+        """Upserts the participants and scans rows of a 'Subject' (run)
+
+            Args:
+                subj: The Subject class object
+                participant: A participants row to use instead of subj.participants
+        """
+
+        self.upsert_participant(dict(participant) if participant is not None else subj.participants)
+        self.upsert_scan(subj.subinfo, subj.scans)
+
+    def flush(self, root=None):
+        """Writes the tables that changed since the last flush and empties the journal
+
+            Args:
+                root: Write the files under this directory instead of output_root (for example a staging directory)
+        """
+
+        root = self.output_root if root is None else root
+        for path in sorted(self._dirty):
+            if path == 'participants.tsv':
+                table = 'participants.tsv'
+                rows = [self.participants[key] for key in sorted(self.participants)]
+            else:
+                table = 'scans.tsv'
+                rows = [self.scans[path][key] for key in sorted(self.scans[path])]
+
+            fieldnames = list(_getdefault('BIDS_fNIRS_subject_folder.json', table).keys())
+            for row in rows:
+                fieldnames += [key for key in row if key not in fieldnames]
+            fname = os.path.join(root, path)
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            _write_tsv_rows(fname + '.tmp', fieldnames, rows)
+            os.replace(fname + '.tmp', fname)
+
+        self._dirty.clear()
+        self._pending = 0
+        if self._journal is not None and os.path.exists(self._journal):
+            os.remove(self._journal)
+
+
+def snirf_to_bids(inputpath: str, outputpath: str, participants: dict = None, data_mode: str = None,
+                  tables: DatasetTables = None):
+    """Creates a BIDS-compliant folder structure (right now, just the metadata files) from a SNIRF file
+
+        Every /nirs{i}/data{j} block of the file is exported as its own run (see subjects_from_snirf).
+
+        The files are written to a staging directory and moved into outputpath only once every file was written and
+        checked, so a failed conversion leaves no partial output behind.
+
+        Args:
+            inputpath: The file path to the reference SNIRF file
+            outputpath: The file path/directory for the created BIDS metadata files
+            participants: A dictionary with participant information
+                Example =
+                    {participant_id: 'sub-01',
+                     age: 34,
+                     sex: 'M'}
+            data_mode: Also place the SNIRF data file at the path of its scans.tsv row (outputpath/nirs/...), with
+                one of the modes of place_snirf. By default, only the metadata files are written
+            tables: Optional DatasetTables of outputpath the participants and scans rows are upserted into, once the
+                files are in place; the caller then flushes it once after converting every file. By default, the rows
+                are upserted into the participants.tsv and scans.tsv files of outputpath, which are rewritten. With a
+                DatasetTables that is not flat, the files are written in the BIDS layout its scans rows point to: the
+                metadata (and data) files of every run go to outputpath/sub-<label>/[ses-<label>/]nirs
+
+        Raises:
+            ValueError: If data_mode is unknown or tables is not a DatasetTables of outputpath
+    """
+
+    if data_mode is not None:
+        _check_data_mode(data_mode)
+    if tables is not None and os.path.abspath(tables.output_root) != os.path.abspath(outputpath):
+        raise ValueError('The tables of ' + tables.output_root + ' cannot hold the rows of ' + outputpath)
+
+    with _stage('convert', inputpath):
+        subjs = subjects_from_snirf(inputpath)
+        layout = tables is not None and not tables.flat
+        with _staged_output(outputpath) as staging:
+            subjdirs = [os.path.join(staging, _make_subjdir(subj.subinfo)) if layout else staging for subj in subjs]
+            sessions = {}
+            with ExportWriter() as writer:
+                for subj, subjdir in zip(subjs, subjdirs):
+                    folder = os.path.join(subjdir, 'nirs') if layout else staging
+                    os.makedirs(folder, exist_ok=True)
+                    subj.export('Folder', folder, writer=writer, session=_claim_session(sessions, subj, folder))
+                    with _stage('check', inputpath):
+                        _compliancy_check(subj, flat=not layout)
+            _raise_failed(writer)
+            if tables is None:
+                own = DatasetTables(outputpath, flat=True)
+                for subj in subjs:
+                    own.add(subj, participants)
+                own.flush(staging)
+            if data_mode is not None:
+                _place_data(inputpath, subjs, subjdirs, data_mode)
+        for subj in subjs:
+            _unstage(subj, staging, outputpath)
+
+        # the caller's tables only get the rows of runs whose files are in place
+        if tables is not None:
+            for subj in subjs:
+                tables.add(subj, participants)
+
+
+def _find_snirf(input_root):
+    """Finds every SNIRF file under a directory
+
+        Args:
+            input_root: The directory to search (recursively)
+
+        Returns:
+            A sorted list of the file paths to the SNIRF files
+    """
+
+    found = []
+    for dirpath, dirnames, filenames in os.walk(input_root):
+        for filename in filenames:
+            if filename.endswith('.snirf'):
+                found.append(os.path.join(dirpath, filename))
+    return sorted(found)
+
+
+# Names of the metadata files written by Subject.export('Folder'), as (classname, parameter) pairs for _make_filename
+_EXPORT_FILES = [('coordsystem', None), ('optodes', None), ('optodes', 'sidecar'), ('channels', None),
+                 ('channels', 'sidecar'), ('sidecar', None), ('events', None), ('events', 'sidecar')]
+
+_MANIFEST = '.snirf2bids_manifest.json'
+_MANIFEST_FORMAT = 2  # bumped whenever the layout of the manifest entries changes
+_INDEX = '.snirf2bids_index.npz'
+_BATCH_FILES = 16  # the most SNIRF files a worker converts with a single ExportWriter
+
+
+def _fingerprint(inputpath, checksum=False):
+    """Computes the fingerprint used to tell whether a SNIRF file changed since it was last converted
+
+        Args:
+            inputpath: The file path to the reference SNIRF file
+            checksum: Also compute a SHA-256 hash of the file content
+
+        Returns:
+            A dictionary with the size, modification time (in ns) and, optionally, the content hash of the file
+    """
+
+    stat = os.stat(inputpath)
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if checksum:
+        sha = hashlib.sha256()
+        with open(inputpath, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                sha.update(chunk)
+        fingerprint['sha256'] = sha.hexdigest()
+    return fingerprint
+
+
+def _is_up_to_date(entry, inputpath, output_root, checksum=False, data_mode=None):
+    """Checks a manifest entry against the current SNIRF file and its outputs
+
+        Args:
+            entry: The manifest entry of the SNIRF file (None if the file is new)
+            inputpath: The file path to the reference SNIRF file
+            output_root: The root directory of the BIDS dataset
+            checksum: Compare content hashes when the size matches but the modification time does not
+            data_mode: The way the SNIRF data file is placed (see place_snirf), None if it is not
+
+        Returns:
+            True if the file does not need to be converted again and False otherwise
+    """
+
+    if entry is None or entry.get('version') != __version__ or entry.get('data_mode') != data_mode:
+        return False
+    if not all(os.path.exists(os.path.join(output_root, fname)) for fname in entry['outputs']):
+        return False
+
+    old = entry['fingerprint']
+    new = _fingerprint(inputpath)
+    if new['size'] != old['size']:
+        return False
+    if new['mtime_ns'] == old['mtime_ns']:
+        return True
+    if checksum and 'sha256' in old:
+        return _fingerprint(inputpath, checksum=True)['sha256'] == old['sha256']
+    return False
+
+
+def _load_manifest(output_root):
+    """Loads the conversion manifest of a BIDS dataset
+
+        Args:
+            output_root: The root directory of the BIDS dataset
+
+        Returns:
+            The manifest entries keyed by SNIRF file path (relative to the input root), or an empty dictionary if
+            there is no (readable) manifest or if it was written in an older format
+    """
+
+    fname = os.path.join(output_root, _MANIFEST)
+    if not os.path.exists(fname):
+        return {}
+    try:
+        with open(fname) as file:
+            manifest = json.load(file)
+        if manifest.get('format') != _MANIFEST_FORMAT:
+            return {}
+        return manifest['files']
+    except (ValueError, KeyError):
+        warn('Ignoring unreadable manifest ' + fname)
+        return {}
+
+
+def _save_manifest(output_root, entries):
+    """Saves the conversion manifest of a BIDS dataset (replacing the previous one in a single rename)
+
+        Args:
+            output_root: The root directory of the BIDS dataset
+            entries: The manifest entries keyed by SNIRF file path (relative to the input root)
+    """
+
+    fname = os.path.join(output_root, _MANIFEST)
+    with open(fname + '.tmp', 'w') as file:
+        json.dump({'version': __version__, 'format': _MANIFEST_FORMAT, 'files': entries}, file, indent=4)
+    os.replace(fname + '.tmp', fname)
+
+
+def _convert_snirf(inputpaths, output_root, profile=False, data_mode=None):
+    """Converts a batch of SNIRF files for dataset_to_bids (runs inside a worker process)
+
+        The metadata files are written into the nirs folder of the subject/session each file belongs to. The files of
+        a SNIRF file are staged and moved into place only once every run of the file was converted (see _convert_runs).
+
+        Args:
+            inputpaths: The file paths to the SNIRF files of the batch
+            output_root: The root directory of the BIDS dataset
+            profile: Profile the conversion and return the Profiler records (to hand them back from a worker process)
+            data_mode: Also place the SNIRF data files (see place_snirf)
+
+        Returns:
+            A dictionary with, keyed by file path, the result of every file ('files', see _convert_runs) and the
+            Profiler records ('profile') if profile is True
+    """
+
+    if not profile:
+        return {'files': _convert_runs(inputpaths, output_root, data_mode)}
+
+    with Profiler() as profiler:
+        files = _convert_runs(inputpaths, output_root, data_mode)
+    return {'files': files, 'profile': profiler.records}
+
+
+def _planned_outputs(subjs, data_mode=None):
+    """Lists the files the conversion of a SNIRF file writes in a BIDS dataset, without extracting anything
+
+        Args:
+            subjs: The Subject class objects (runs) of the SNIRF file (lazy Subjects are not loaded)
+            data_mode: The way the SNIRF data file is placed (see place_snirf), None if it is not
+
+        Returns:
+            The list of file paths relative to the dataset root: the metadata files of every run, followed by the
+            data files if data_mode is given
+    """
+
+    outputs = []
+    for subj in subjs:
+        subjdir = _make_subjdir(subj.subinfo)
+        for classname, parameter in _EXPORT_FILES:
+            fname = subjdir + '/nirs/' + _make_filename(classname, subj.subinfo, parameter)
+            if fname not in outputs:
+                outputs.append(fname)
+    if data_mode is not None:
+        outputs += [_make_subjdir(subj.subinfo) + '/nirs/' + _make_filename('nirs', subj.subinfo) for subj in subjs]
+    return outputs
+
+
+def _convert_runs(inputpaths, output_root, data_mode=None):
+    """Converts every run of a batch of SNIRF files into a BIDS dataset (see _convert_snirf)
+
+        The metadata files of the whole batch are queued on a single ExportWriter, which is drained once after the last
+        file was extracted, so that the writes of a file overlap the extraction of the next ones. Each file still has
+        its own staging directory, moved into place only if every write of the file succeeded.
+
+        Returns:
+            A dictionary keyed by file path, with the subject info, participants row, scans row and BIDSIndex row of
+            every run ('runs'), the metadata and data files produced, relative to the output root ('outputs'), and the
+            SHA-256 hashes of the data files ('data') of every converted file, or the exception raised ('error') for a
+            file that failed
+    """
+
+    os.makedirs(output_root, exist_ok=True)
+    results = {}
+    batch = []
+    try:
+        with ExportWriter() as writer:
+            for inputpath in inputpaths:
+                staging = tempfile.mkdtemp(prefix=_STAGING_PREFIX, dir=output_root)
+                batch.append((inputpath, staging))
+                try:
+                    with _stage('convert', inputpath):
+                        results[inputpath] = _export_runs(inputpath, staging, writer)
+                except Exception as e:
+                    results[inputpath] = {'error': e}
+
+        for inputpath, staging in batch:
+            if 'error' in results[inputpath]:
+                continue
+            try:
+                with _stage('convert', inputpath):
+                    results[inputpath] = _commit_runs(inputpath, staging, output_root, data_mode,
+                                                      **results[inputpath])
+            except Exception as e:
+                results[inputpath] = {'error': e}
+    finally:
+        for inputpath, staging in batch:
+            shutil.rmtree(staging, ignore_errors=True)
+    return results
+
+
+def _export_runs(inputpath, staging, writer):
+    """Extracts every run of a SNIRF file and queues its metadata files on an ExportWriter (see _convert_runs)
+
+        Returns:
+            A dictionary with the Subjects ('subjs') and the futures of their writes ('futures')
+    """
+
+    subjs = subjects_from_snirf(inputpath)
+    sessions = {}
+    futures = []
+    for subj in subjs:
+        outputpath = os.path.join(staging, _make_subjdir(subj.subinfo), 'nirs')
+        os.makedirs(outputpath, exist_ok=True)
+        futures += subj.export('Folder', outputpath, writer=writer, session=_claim_session(sessions, subj, outputpath))
+        with _stage('check', inputpath):
+            _compliancy_check(subj)
+    return {'subjs': subjs, 'futures': futures}
+
+
+def _commit_runs(inputpath, staging, output_root, data_mode, subjs, futures):
+    """Places the data files of a SNIRF file whose metadata files were written and moves its output into place
+
+        Raises:
+            Exception: The first error of the metadata file writes of the file, if any
+    """
+
+    for future in futures:
+        if future.exception() is not None:
+            raise future.exception()
+
+    outputs = _planned_outputs(subjs)
+    data = {}
+    if data_mode is not None:
+        placed = _place_data(inputpath, subjs, [os.path.join(staging, _make_subjdir(subj.subinfo)) for subj in subjs],
+                             data_mode)
+        for dst, sha256 in placed.items():
+            fname = os.path.relpath(dst, staging).replace(os.sep, '/')
+            outputs.append(fname)
+            data[fname] = sha256
+    _commit_staging(staging, output_root)
+
+    runs = [{'subinfo': subj.subinfo, 'participants': subj.participants, 'scans': subj.scans,
+             'index': _index_row(subj)} for subj in subjs]
+    return {'runs': runs, 'outputs': outputs, 'data': data}
+
+
+def _write_tsv_rows(fname, fieldnames, rows):
+    """Writes a list of dictionaries as the rows of a TSV file ('n/a' for missing values)
+
+        Args:
+            fname: The file path to the output TSV file
+            fieldnames: The column names of the TSV file
+            rows: The list of rows (dictionaries keyed by column name)
+    """
+
+    with open(fname, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter="\t", quotechar='"', restval='n/a')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({key: 'n/a' if value is None else value for key, value in row.items()})
+
+
+def dataset_to_bids(input_root: str, output_root: str, workers: int = None, incremental: bool = True,
+                    checksum: bool = False, data_mode: str = None, progress=None):
+    """Creates a BIDS-compliant dataset (right now, just the metadata files) from every SNIRF file in a directory
+
+        The files are converted in parallel in a process pool. The participants and scans rows of every file are then
+        merged in a single step: one participants.tsv at the dataset root (one row per participant) and one
+        sub-<label>[_ses-<label>]_scans.tsv per subject/session folder.
+
+        A BIDSIndex of all the runs is saved as .snirf2bids_index.npz at the output root.
+
+        Every conversion is recorded in a manifest (.snirf2bids_manifest.json) at the output root with the size,
+        modification time and (optionally) content hash of the SNIRF file, the snirf2bids version and the metadata
+        files produced. On the next run, files whose fingerprint, version and outputs are unchanged are skipped.
+
+        Args:
+            input_root: The directory to search (recursively) for SNIRF files
+            output_root: The root directory of the created BIDS dataset
+            workers: The number of worker processes (defaults to the number of CPUs). With 1 worker, the files are
+                converted in the calling process
+            incremental: Skip the SNIRF files that are up to date according to the manifest. If False, every file
+                is converted again
+            checksum: Record a SHA-256 hash of each SNIRF file and, when only the modification time of a file
+                changed, compare hashes before converting it again
+            data_mode: Also place every SNIRF data file into its sub-<label>/[ses-<label>/]nirs/ folder, with one of
+                the modes of place_snirf. By default, only the metadata files are written
+            progress: Optional function called as progress(done, total, inputpath, error) every time a file has been
+                converted (error is None) or has failed (error is the exception); total counts the files that are
+                not up to date
+
+        Returns:
+            The list of the file paths to the SNIRF files that were converted in this run. Files that fail to convert
+            are skipped with a warning
+    """
+
+    return _convert_dataset(_find_snirf(input_root), input_root, output_root, workers, incremental, checksum,
+                            data_mode, progress)
+
+
+def _convert_dataset(inputpaths, input_root, output_root, workers=None, incremental=True, checksum=False,
+                     data_mode=None, progress=None):
+    """Converts a list of SNIRF files into a BIDS dataset (see dataset_to_bids)
+
+        Args:
+            inputpaths: The file paths to the SNIRF files
+            input_root: The directory the manifest keys of the files are relative to
+            output_root: The root directory of the created BIDS dataset
+            workers, incremental, checksum, data_mode, progress: See dataset_to_bids
+
+        Returns:
+            The list of the file paths to the SNIRF files that were converted
+    """
+
+    if data_mode is not None:
+        _check_data_mode(data_mode)
+    os.makedirs(output_root, exist_ok=True)
+
+    manifest = _load_manifest(output_root)
+    entries = {}
+    todo = []
+    for inputpath in inputpaths:
+        key = os.path.relpath(inputpath, input_root).replace(os.sep, '/')
+        if incremental and _is_up_to_date(manifest.get(key), inputpath, output_root, checksum, data_mode):
+            # keep the content hash but refresh the size/mtime, so a touched file is only hashed once
+            fingerprint = dict(manifest[key]['fingerprint'], **_fingerprint(inputpath))
+            entries[key] = dict(manifest[key], fingerprint=fingerprint)
+        else:
+            todo.append(inputpath)
+
+    results = {}
+    failed = []
+
+    def report(inputpath, error=None):
+        if error is not None:
+            failed.append(inputpath)
+            warn('Failed to convert ' + inputpath + ': ' + repr(error))
+        if progress is not None:
+            progress(len(results) + len(failed), len(todo), inputpath, error)
+
+    def collect(batch, result=None, error=None):
+        for record in (result or {}).get('profile', []):
+            for profiler in list(_PROFILERS):
+                profiler.add(record)
+        for inputpath in batch:
+            outcome = result['files'][inputpath] if error is None else {'error': error}
+            if 'error' in outcome:
+                report(inputpath, outcome['error'])
+            else:
+                results[inputpath] = outcome
+                report(inputpath)
+
+    # each worker converts its files in batches, sharing one ExportWriter per batch (see _convert_runs)
+    size = max(1, min(_BATCH_FILES, -(-len(todo) // (workers or os.cpu_count() or 1))))
+    batches = [todo[i:i + size] for i in range(0, len(todo), size)]
+    if workers == 1:
+        for batch in batches:
+            try:
+                result = _convert_snirf(batch, output_root, data_mode=data_mode)
+            except Exception as e:
+                collect(batch, error=e)
+                continue
+            collect(batch, result)
+    elif len(batches) > 0:
+        # the worker processes profile themselves and hand their records back to the active Profilers
+        profile = len(_PROFILERS) > 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_convert_snirf, batch, output_root, profile, data_mode): batch
+                       for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    collect(batch, error=e)
+                    continue
+                collect(batch, result)
+
+    for inputpath, record in results.items():
+        key = os.path.relpath(inputpath, input_root).replace(os.sep, '/')
+        entries[key] = dict(record, fingerprint=_fingerprint(inputpath, checksum), version=__version__,
+                            data_mode=data_mode)
+    _save_manifest(output_root, entries)
+
+    # Reduce: one row per participant, one scans file per subject/session folder. The existing tables (and journal)
+    # are kept: the rows of the converted files are upserted, and those of the up-to-date files only if missing
+    tables = DatasetTables(output_root, journal=True)
+    converted = {os.path.relpath(inputpath, input_root).replace(os.sep, '/') for inputpath in results}
+    for key in sorted(entries):
+        for run in entries[key]['runs']:
+            if key in converted or run['participants']['participant_id'] not in tables.participants:
+                tables.upsert_participant(run['participants'])
+            if key in converted or not tables.has_scan(run['subinfo'], run['scans']['filename']):
+                tables.upsert_scan(run['subinfo'], run['scans'])
+    tables.flush()
+
+    index = BIDSIndex()
+    for key in sorted(entries):
+        for run in entries[key]['runs']:
+            index.add_row(run['index'])
+    index.save(os.path.join(output_root, _INDEX))
+
+    return [inputpath for inputpath in todo if inputpath in results]
+
+
+def _index_row(subj):
+    """Makes the BIDSIndex row of a 'Subject' (run)
+
+        Args:
+            subj: The Subject class object
+
+        Returns:
+            A dictionary with the sub/ses/task/run labels, the data file name (relative to the subject/session folder),
+            the metadata file names (relative to the dataset root) and every scalar field of the _nirs.json sidecar
+    """
+
+    row = {'sub': subj.subinfo['sub-'], 'ses': subj.subinfo['ses-'], 'task': subj.subinfo['task-'],
+           'run': subj.subinfo['run-'], 'filename': subj.scans['filename']}
+
+    subjdir = _make_subjdir(subj.subinfo)
+    for fnames in subj.pull_fnames():
+        if fnames is not None:
+            for key, fname in fnames.items():
+                row[key] = subjdir + '/nirs/' + fname
+
+    for name, field in subj.sidecar._fields.items():
+        value = field.value
+        if name == 'path2origin' or value is None or np.ndim(value) != 0:
+            continue
+        row[name] = value if isinstance(value, str) else float(value)
+    return row
+
+
+class BIDSIndex:
+    """In-memory columnar index of the runs of a BIDS dataset
+
+    Every row describes one run (see _index_row): its sub/ses/task/run labels, its file names and its _nirs.json
+    sidecar fields. Lookups go through per-column hash tables built on first use, and the index is saved to and loaded
+    from a single compressed NumPy (.npz) file, so querying it never touches the per-file JSON sidecars.
+
+    Attributes:
+        _columns: A dictionary of the column values (lists), in insertion order
+        _count: The number of rows
+        _lookup: Per-column hash tables (value -> row numbers), built on first use
+    """
+
+    def __init__(self):
+        """Constructor for an empty BIDSIndex"""
+        self._columns = {}
+        self._count = 0
+        self._lookup = {}
+
+    def __len__(self):
+        return self._count
+
+    def add(self, subj):
+        """Adds a 'Subject' (run) to the index
+
+            Args:
+                subj: The Subject class object
+        """
+        self.add_row(_index_row(subj))
+
+    def add_row(self, row):
+        """Adds a row to the index (missing columns are None)
+
+            Args:
+                row: A dictionary of column values
+        """
+        for name, value in row.items():
+            if name not in self._columns:
+                self._columns[name] = [None] * self._count
+        for name, column in self._columns.items():
+            column.append(row.get(name))
+        self._count += 1
+        self._lookup = {}
+
+    def column(self, name):
+        """Obtains the values of a column
+
+            Args:
+                name: The column name
+
+            Returns:
+                The list of values of the column (None where a row has no value)
+        """
+        return list(self._columns[name])
+
+    def row(self, i):
+        """Obtains a row of the index
+
+            Args:
+                i: The row number
+
+            Returns:
+                A dictionary of the (non-missing) column values of the row
+        """
+        return {name: column[i] for name, column in self._columns.items() if column[i] is not None}
+
+    def query(self, **criteria):
+        """Finds the rows matching all the given column values
+
+            Args:
+                criteria: Column name/value pairs, for example sub='01', task='tapping' or SamplingFrequency=10.0. A
+                    list, tuple or set matches any of its values
+
+            Returns:
+                The list of matching rows (see row)
+
+            Example:
+                index.query(sub='01', run=['1', '2'])
+        """
+        matches = None
+        for name, wanted in criteria.items():
+            if name not in self._columns:
+                return []
+            if name not in self._lookup:
+                lookup = {}
+                for i, value in enumerate(self._columns[name]):
+                    lookup.setdefault(value, []).append(i)
+                self._lookup[name] = lookup
+
+            values = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+            rows = set()
+            for value in values:
+                rows.update(self._lookup[name].get(value, []))
+            matches = rows if matches is None else matches & rows
+            if not matches:
+                return []
+
+        rows = range(self._count) if matches is None else sorted(matches)
+        return [self.row(i) for i in rows]
+
+    def save(self, fpath):
+        """Saves the index as a compressed NumPy (.npz) file
+
+            Numeric columns are stored as float arrays (NaN for missing values) and the other columns as string arrays
+            with a separate missing-value mask.
+
+            Args:
+                fpath: The file path to the output .npz file
+        """
+        arrays = {}
+        for name, column in self._columns.items():
+            missing = np.array([value is None for value in column], dtype=bool)
+            if all(isinstance(value, (int, float)) for value in column if value is not None):
+                arrays['num:' + name] = np.array([np.nan if value is None else value for value in column], dtype=float)
+            else:
+                arrays['str:' + name] = np.array(['' if value is None else str(value) for value in column], dtype=str)
+                arrays['nan:' + name] = missing
+        with open(fpath, 'wb') as file:
+            np.savez_compressed(file, **arrays)
+
+    @classmethod
+    def load(cls, fpath):
+        """Loads an index saved with BIDSIndex.save
+
+            Args:
+                fpath: The file path to the .npz file
+
+            Returns:
+                The BIDSIndex
+        """
+        index = cls()
+        with np.load(fpath, allow_pickle=False) as arrays:
+            for key in arrays.files:
+                kind, name = key.split(':', 1)
+                if kind == 'num':
+                    index._columns[name] = [None if np.isnan(value) else value for value in arrays[key].tolist()]
+                elif kind == 'str':
+                    missing = arrays['nan:' + name]
+                    index._columns[name] = [None if gone else value
+                                            for value, gone in zip(arrays[key].tolist(), missing.tolist())]
+        index._count = len(next(iter(index._columns.values()), []))
+        return index
+
+
+# Requirement levels of the fields in the defaults JSON files, from the least to the most severe when missing
+LEVELS = ('OPTIONAL', 'CONDITIONAL', 'RECOMMENDED', 'REQUIRED')
+
+# Subject components checked by the Validator: component -> (class name, defaults key, file name table key)
+_VALIDATED = {
+    'coordsystem': ('Coordsystem', '_coordsystem.json', ('coordsystem', None)),
+    'optodes': ('Optodes', '_optodes.tsv', ('optodes', None)),
+    'channel': ('Channels', '_channels.tsv', ('channels', None)),
+    'sidecar': ('Sidecar', '_nirs.json', ('sidecar', None)),
+    'events': ('Events', '_events.tsv', ('events', None)),
+    'participants': ('Participants', 'participants.tsv', None),
+    'scans': ('Scans', 'scans.tsv', ('scans', None)),
+}
+
+
+def _rules(key):
+    """Compiles the field rules of a BIDS file from the defaults registry
+
+        The rules are compiled once per file and kept until the defaults are reloaded (see reload_defaults).
+
+        Args:
+            key: The defaults key of the file ('_nirs.json', '_channels.tsv', 'participants.tsv', ...)
+
+        Returns:
+            A tuple of (field, level, rank) rules, rank being the index of the level in LEVELS
+    """
+
+    rules = _RULES.get(key)
+    if rules is None:
+        spec = _getdefault('BIDS_fNIRS_subject_folder.json', key)
+        rules = tuple((field, level, LEVELS.index(level)) for field, level in spec.items()
+                      if field != 'RequirementLevel' and level in LEVELS)
+        _RULES[key] = rules
+    return rules
+
+
+def _level_rank(level):
+    """The index of a requirement level in LEVELS
+
+        Raises:
+            ValueError: If level is not one of LEVELS
+    """
+    if level not in LEVELS:
+        raise ValueError('Unknown requirement level ' + repr(level) + ', expected one of ' + ', '.join(LEVELS))
+    return LEVELS.index(level)
+
+
+def _finding_message(finding):
+    """Formats a validation finding as a message (FATAL for a REQUIRED level, WARNING otherwise)"""
+    prefix = 'FATAL: ' if finding['level'] == 'REQUIRED' else 'WARNING: '
+    if 'message' in finding:
+        return prefix + finding['message'] + ' (' + finding['file'] + ')'
+    return (prefix + 'The field ' + finding['field'] + ' is ' + finding['level'] + ' in the ' + finding['class'] +
+            ' class (' + finding['file'] + ')')
+
+
+class Validator:
+    """Checks 'Subjects' against the REQUIRED, RECOMMENDED, CONDITIONAL and OPTIONAL fields of the defaults JSON files
+
+    The rules are compiled from the defaults registry when the validator is created, so checking a run is a loop over
+    precompiled (field, level) pairs. Every missing field is reported as a finding, a dictionary with the SNIRF file
+    ('source'), the run ('run', the file name stem of the run), the BIDS file ('file', relative to the dataset root, or
+    to the output folder for the flat snirf_to_bids layout), the metadata 'class', the 'field' and its requirement
+    'level'.
+
+    Attributes:
+        level: The least severe requirement level reported
+        fail_level: A run fails if a field at this level or a more severe one is missing
+    """
+
+    def __init__(self, level='RECOMMENDED', fail_level='REQUIRED'):
+        """Compiles the rules
+
+            Args:
+                level: The least severe requirement level reported (one of LEVELS)
+                fail_level: The least severe requirement level that fails a run (one of LEVELS)
+
+            Raises:
+                ValueError: If a level is not one of LEVELS
+        """
+
+        rank = _level_rank(level)
+        _level_rank(fail_level)
+        self.level = level
+        self.fail_level = fail_level
+        self._rules = {}
+        for component, (classname, key, table_key) in _VALIDATED.items():
+            rules = tuple((field, level) for field, level, field_rank in _rules(key) if field_rank >= rank)
+            if rules:
+                self._rules[component] = rules
+
+    def check(self, subj, source=None, flat=False):
+        """Checks a single 'Subject'/run
+
+            Args:
+                subj: The Subject
+                source: The file path to the reference SNIRF file, recorded in the findings
+                flat: Report the files of the flat snirf_to_bids layout (every file, including scans.tsv, in a single
+                    folder) instead of the BIDS layout (sub-<label>/[ses-<label>/]nirs/...)
+
+            Returns:
+                The list of findings, in component and field order
+        """
+
+        fnames = subj.filenames
+        subjdir = fnames[('subjdir', None)]
+        run = fnames[('scans', 'init')]
+        findings = []
+        for component, rules in self._rules.items():
+            classname, key, table_key = _VALIDATED[component]
+            if table_key is None:
+                fname = key
+            elif flat:
+                fname = 'scans.tsv' if component == 'scans' else fnames[table_key]
+            elif component == 'scans':
+                fname = subjdir + '/' + fnames[table_key]
+            else:
+                fname = subjdir + '/nirs/' + fnames[table_key]
+            value = getattr(subj, component)
+            if isinstance(value, dict):
+                missing = [(field, level) for field, level in rules if value.get(field) is None]
+            else:
+                missing = [(field, level) for field, level in rules if getattr(value, field, None) is None]
+            findings += [{'source': source, 'run': run, 'file': fname, 'class': classname, 'field': field,
+                          'level': level} for field, level in missing]
+        return findings
+
+    def validate(self, subjects, report=None, callback=None):
+        """Checks a stream of 'Subjects', one at a time
+
+            Args:
+                subjects: An iterable of Subjects, or of (source, Subject) pairs. A generator keeps a single run in
+                    memory at a time
+                report: A ValidationReport to add the findings to (a new one by default)
+                callback: A function called with every Subject and its findings once it has been checked
+
+            Returns:
+                The ValidationReport
+        """
+
+        if report is None:
+            report = ValidationReport(self.fail_level)
+        for subj in subjects:
+            source, subj = subj if isinstance(subj, tuple) else (None, subj)
+            findings = self.check(subj, source)
+            report.add(findings)
+            if callback is not None:
+                callback(subj, findings)
+        return report
+
+
+class ValidationReport:
+    """Findings of a validation run (see Validator)
+
+    Attributes:
+        fail_level: A run fails if one of its findings is at this level or a more severe one
+        runs: The number of runs checked
+        findings: The findings, in check order
+        errors: (source, message) pairs of the files that could not be checked (which fail)
+    """
+
+    def __init__(self, fail_level='REQUIRED'):
+        self._fail_rank = _level_rank(fail_level)
+        self.fail_level = fail_level
+        self.runs = 0
+        self.findings = []
+        self.errors = []
+
+    def add(self, findings, runs=1):
+        """Adds the findings of checked runs"""
+        self.runs += runs
+        self.findings += findings
+
+    def add_error(self, source, error):
+        """Records a file that could not be checked"""
+        self.errors.append((source, repr(error) if isinstance(error, BaseException) else str(error)))
+
+    def counts(self):
+        """The number of findings at every requirement level"""
+        counts = dict.fromkeys(LEVELS, 0)
+        for finding in self.findings:
+            counts[finding['level']] += 1
+        return counts
+
+    def failed(self):
+        """The runs that fail, as (source, run) pairs, followed by the files that could not be checked
+
+            Returns:
+                A sorted list of (source, run) pairs; run is None for a file that could not be checked
+        """
+        failed = {(finding['source'], finding['run']) for finding in self.findings
+                  if LEVELS.index(finding['level']) >= self._fail_rank}
+        return sorted(failed, key=str) + [(source, None) for source, message in self.errors]
+
+    @property
+    def passed(self):
+        """Whether no run fails"""
+        return not self.failed()
+
+    def to_dict(self):
+        """The report as a JSON-serializable dictionary"""
+        return {'fail_level': self.fail_level, 'runs': self.runs, 'passed': self.passed, 'counts': self.counts(),
+                'failed': [{'source': source, 'run': run} for source, run in self.failed()],
+                'findings': self.findings,
+                'errors': [{'source': source, 'message': message} for source, message in self.errors]}
+
+    def save(self, fpath):
+        """Writes the report as JSON
+
+            Args:
+                fpath: The file path to the output JSON file
+        """
+        with open(fpath, 'w') as file:
+            json.dump(self.to_dict(), file, indent=4)
+
+
+def _validate_snirf_file(inputpath, level):
+    """Checks every run of a SNIRF file (in a worker process)
+
+        Returns:
+            A (findings, number of runs) pair
+    """
+    validator = Validator(level)
+    subjs = subjects_from_snirf(inputpath)
+    findings = []
+    for subj in subjs:
+        findings += validator.check(subj, inputpath)
+    return findings, len(subjs)
+
+
+def _validate_pool(check, items, args, workers, report, progress):
+    """Runs a validation check on every item, in a process pool, and adds the results to a report
+
+        Args:
+            check: The function checking an item, called as check(item, *args) and returning a (findings, number of
+                runs) pair
+            items: The items (file or folder paths)
+            args: The other arguments of check
+            workers: The number of worker processes (defaults to the number of CPUs, 1 checks in the calling process)
+            report: The ValidationReport; an item whose check raises is recorded as an error
+            progress: A function called as progress(done, total, item, error) after every item
+    """
+
+    checked = []
+
+    def record(item, result=None, error=None):
+        checked.append(item)
+        if error is None:
+            report.add(*result)
+        else:
+            report.add_error(item, error)
+        if progress is not None:
+            progress(len(checked), len(items), item, error)
+
+    if workers == 1:
+        for item in items:
+            try:
+                result = check(item, *args)
+            except Exception as e:
+                record(item, error=e)
+                continue
+            record(item, result)
+    elif len(items) > 0:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(check, item, *args): item for item in items}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    record(futures[future], error=e)
+                    continue
+                record(futures[future], result)
+
+
+def validate_snirf(inputpaths, workers=None, level='RECOMMENDED', fail_level='REQUIRED', progress=None):
+    """Validates the runs of SNIRF files, in a process pool
+
+        Args:
+            inputpaths: The file paths to the SNIRF files
+            workers: The number of worker processes (defaults to the number of CPUs, 1 validates in the calling
+                process)
+            level: The least severe requirement level reported (see Validator)
+            fail_level: The least severe requirement level that fails a run
+            progress: A function called as progress(done, total, inputpath, error) after every file
+
+        Returns:
+            The ValidationReport
+
+        Raises:
+            ValueError: If a level is not one of LEVELS
+    """
+
+    _level_rank(level)  # raises on unknown levels before any file is read
+    report = ValidationReport(fail_level)
+    _validate_pool(_validate_snirf_file, list(inputpaths), (level,), workers, report, progress)
+    return report
+
+
+# Metadata files of a nirs folder checked by validate_bids: component -> metadata class
+_TREE_CLASSES = {'coordsystem': Coordsystem, 'optodes': Optodes, 'channel': Channels, 'sidecar': Sidecar,
+                 'events': Events}
+# Run-level file name suffixes, from which the runs of a nirs folder are found
+_RUN_SUFFIXES = ('_nirs.json', '_channels.tsv', '_events.tsv')
+# Sidecar counts of the channels.tsv rows of each channel type (NIRS types start with NIRS)
+_CHANNEL_COUNTS = (('NIRSChannelCount', 'NIRS'), ('ACCELChannelCount', 'ACCEL'), ('GYROChannelCount', 'GYRO'),
+                   ('MAGNChannelCount', 'MAGN'))
+
+
+def _count_finding(source, run, fname, classname, field, expected, found, what):
+    """Makes the finding of a count that does not match the rows of a TSV file"""
+    count = ' is missing' if expected is None else ' is ' + str(expected)
+    return {'source': source, 'run': run, 'file': fname, 'class': classname, 'field': field, 'level': 'REQUIRED',
+            'message': field + count + ' but there are ' + str(found) + ' ' + what}
+
+
+def _type_counts(tsv, fpath):
+    """Reads the type column of a TSV file (when only its header was read) and counts the rows of every type"""
+    tsv.load_from_tsv(fpath)
+    if getattr(tsv, 'type', None) is None:
+        return {}
+    types, counts = np.unique(np.asarray(tsv.type, dtype=str), return_counts=True)
+    return dict(zip(types.tolist(), counts.tolist()))
+
+
+def _validate_nirs_folder(folder, output_root, level):
+    """Checks the metadata files of a sub-<label>/[ses-<label>/]nirs folder of a BIDS dataset (in a worker process)
+
+        Every run found in the folder (from its _nirs.json, _channels.tsv or _events.tsv file) is checked for missing
+        files, missing fields and sidecar counts that do not match the rows of its _channels.tsv and _optodes.tsv files.
+        JSON files are read with JSON.load_from_json, and TSV files with TSV.load_from_tsv, reading only the header and
+        the number of rows unless a count has to be broken down by channel/optode type.
+
+        Args:
+            folder: The file path to the nirs folder
+            output_root: The root directory of the BIDS dataset
+            level: The least severe requirement level reported
+
+        Returns:
+            A (findings, number of runs) pair
+    """
+
+    rank = _level_rank(level)
+    subjdir = os.path.relpath(os.path.dirname(folder), output_root).replace(os.sep, '/')
+    stems = sorted({fname[:-len(suffix)] for fname in os.listdir(folder) for suffix in _RUN_SUFFIXES
+                    if fname.endswith(suffix)})
+
+    findings = []
+    loaded = {}  # file name -> (metadata object, number of rows), shared by the runs of a session
+
+    def finding(run, fname, classname, field, level, message=None):
+        found = {'source': output_root, 'run': run, 'file': subjdir + '/nirs/' + fname, 'class': classname,
+                 'field': field, 'level': level}
+        if message is not None:
+            found['message'] = message
+        findings.append(found)
+
+    for run in stems:
+        fnames = _filename_table(parse_bids_name(run + '_nirs.json')[0])
+        objs = {}
+        for component, cls in _TREE_CLASSES.items():
+            classname, key, table_key = _VALIDATED[component]
+            fname = fnames[table_key]
+            fpath = os.path.join(folder, fname)
+            if fname in loaded:
+                objs[component] = loaded[fname]
+                continue
+            if not os.path.isfile(fpath):
+                file_level = _getdefault('BIDS_fNIRS_subject_folder.json', key)['RequirementLevel']
+                if _level_rank(file_level) >= rank:
+                    finding(run, fname, classname, None, file_level, 'The ' + fname + ' file is ' + file_level +
+                            ' and missing')
+                continue
+
+            obj = cls()
+            rows = obj.load_from_json(fpath) if issubclass(cls, JSON) else obj.load_from_tsv(fpath, header_only=True)
+            loaded[fname] = objs[component] = (obj, rows)
+            for field, field_level, field_rank in _rules(key):
+                if field_rank >= rank and getattr(obj, field, None) is None:
+                    finding(run, fname, classname, field, field_level)
+
+        if 'sidecar' not in objs:
+            continue
+        sidecar = objs['sidecar'][0]
+        sidecar_fname = fnames[('sidecar', None)]
+        if 'channel' in objs:
+            channels, rows = objs['channel']
+            declared = {field: getattr(sidecar, field, None) for field, prefix in _CHANNEL_COUNTS}
+            if rows != sum(int(count) for count in declared.values() if count is not None):
+                # the row count alone does not add up: count the rows of every channel type
+                types = _type_counts(channels, os.path.join(folder, fnames[('channels', None)]))
+                for field, prefix in _CHANNEL_COUNTS:
+                    found = sum(count for name, count in types.items() if name.upper().startswith(prefix))
+                    if (declared[field] is not None or found) and int(declared[field] or 0) != found:
+                        findings.append(_count_finding(output_root, run, subjdir + '/nirs/' + sidecar_fname,
+                                                       'Sidecar', field, declared[field], found,
+                                                       prefix + ' rows in ' + fnames[('channels', None)]))
+        if 'optodes' in objs:
+            optodes, rows = objs['optodes']
+            declared = {field: getattr(sidecar, field, None)
+                        for field in ('NIRSSourceOptodeCount', 'NIRSDetectorOptodeCount')}
+            if None not in declared.values() and rows != sum(int(count) for count in declared.values()):
+                types = _type_counts(optodes, os.path.join(folder, fnames[('optodes', None)]))
+                for field, kind in (('NIRSSourceOptodeCount', 'source'), ('NIRSDetectorOptodeCount', 'detector')):
+                    if int(declared[field]) != types.get(kind, 0):
+                        findings.append(_count_finding(output_root, run, subjdir + '/nirs/' + sidecar_fname,
+                                                       'Sidecar', field, declared[field], types.get(kind, 0),
+                                                       kind + ' rows in ' + fnames[('optodes', None)]))
+    return findings, len(stems)
+
+
+def _validate_tables(output_root, folders, level):
+    """Checks the participants.tsv and scans.tsv files of a BIDS dataset: their required columns, and that every
+    subject folder has a participants.tsv row
+
+        Returns:
+            The list of findings
+    """
+
+    rank = _level_rank(level)
+    findings = []
+    scans = sorted({os.path.dirname(folder) for folder in folders})
+    tables = [('participants', os.path.join(output_root, 'participants.tsv'))]
+    tables += [('scans', os.path.join(subjdir, fname)) for subjdir in scans for fname in os.listdir(subjdir)
+               if fname.endswith('_scans.tsv')]
+    for component, fpath in tables:
+        classname, key, table_key = _VALIDATED[component]
+        fname = os.path.relpath(fpath, output_root).replace(os.sep, '/')
+        if not os.path.isfile(fpath):
+            findings.append({'source': output_root, 'run': None, 'file': fname, 'class': classname, 'field': None,
+                             'level': 'REQUIRED', 'message': 'The ' + fname + ' file is missing'})
+            continue
+        names = _read_tsv_header(fpath)[0]
+        findings += [{'source': output_root, 'run': None, 'file': fname, 'class': classname, 'field': field,
+                      'level': field_level} for field, field_level, field_rank in _rules(key)
+                     if field_rank >= rank and field not in names]
+
+        if component == 'participants' and 'participant_id' in names:
+            names, columns = _read_tsv_columns(fpath)
+            participants = set(columns[names.index('participant_id')])
+            subjects = sorted({os.path.relpath(folder, output_root).replace(os.sep, '/').split('/')[0]
+                               for folder in folders})
+            findings += [{'source': output_root, 'run': None, 'file': fname, 'class': classname,
+                          'field': 'participant_id', 'level': 'REQUIRED',
+                          'message': 'The ' + subject + ' folder has no participant_id row'}
+                         for subject in subjects if subject not in participants]
+    return findings
+
+
+def validate_bids(output_root, workers=None, level='RECOMMENDED', fail_level='REQUIRED', progress=None):
+    """Validates the metadata files of an existing BIDS dataset, without the SNIRF files it was converted from
+
+        Every sub-<label>/[ses-<label>/]nirs folder is checked in a worker process (see _validate_nirs_folder): missing
+        files and fields, and sidecar channel/optode counts that disagree with the _channels.tsv/_optodes.tsv rows.
+        participants.tsv and the scans.tsv files are checked for their required columns.
+
+        Args:
+            output_root: The root directory of the BIDS dataset
+            workers: The number of worker processes (defaults to the number of CPUs, 1 validates in the calling
+                process)
+            level: The least severe requirement level reported (see Validator)
+            fail_level: The least severe requirement level that fails a run
+            progress: A function called as progress(done, total, folder, error) after every nirs folder
+
+        Returns:
+            The ValidationReport (the 'source' of every finding is output_root and its 'file' is relative to it)
+
+        Raises:
+            ValueError: If a level is not one of LEVELS
+            FileNotFoundError: If output_root is not a directory
+    """
+
+    _level_rank(level)
+    if not os.path.isdir(output_root):
+        raise FileNotFoundError('No BIDS dataset at ' + output_root)
+    folders = sorted(glob.glob(os.path.join(glob.escape(output_root), 'sub-*', 'nirs')) +
+                     glob.glob(os.path.join(glob.escape(output_root), 'sub-*', 'ses-*', 'nirs')))
+    report = ValidationReport(fail_level)
+    report.add(_validate_tables(output_root, folders, level), runs=0)
+    _validate_pool(_validate_nirs_folder, folders, (output_root, level), workers, report, progress)
+    return report
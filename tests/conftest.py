@@ -0,0 +1,24 @@
+import h5py
+import pytest
+
+from snirf2bids.bench import make_snirf
+
+
+@pytest.fixture(autouse=True)
+def _workdir(tmp_path, monkeypatch):
+    """Runs every test in its own directory (pysnirf2 writes its log file in the working directory)"""
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def raw(tmp_path):
+    """A folder of small synthetic SNIRF files: two subjects, the second one with an ACCEL aux channel"""
+    folder = tmp_path / 'raw'
+    folder.mkdir()
+    make_snirf(str(folder / 'sub-01_task-tap_nirs.snirf'), channels=8, events=4, samples=100)
+    fpath = make_snirf(str(folder / 'sub-02_ses-1_task-tap_run-1_nirs.snirf'), channels=8, events=4, aux=2,
+                       samples=100, seed=1)
+    with h5py.File(fpath, 'a') as f:
+        del f['nirs/aux1/name']
+        f['nirs/aux1/name'] = b'ACCEL_X'
+    return folder
@@ -0,0 +1,32 @@
+import os
+
+from snirf2bids import dataset_to_bids
+from snirf2bids.bench import make_snirf
+
+
+def test_rerun_skips_unchanged_files(raw, tmp_path):
+    output = str(tmp_path / 'bids')
+
+    converted = dataset_to_bids(str(raw), output, workers=1)
+    assert sorted(os.path.basename(fpath) for fpath in converted) == sorted(os.listdir(raw))
+    assert os.path.isfile(os.path.join(output, 'sub-01', 'nirs', 'sub-01_task-tap_channels.tsv'))
+    assert os.path.isfile(os.path.join(output, 'sub-02', 'ses-1', 'nirs', 'sub-02_ses-1_task-tap_run-1_nirs.json'))
+
+    assert dataset_to_bids(str(raw), output, workers=1) == []
+
+    # only the file whose content changed is converted again
+    changed = make_snirf(str(raw / 'sub-01_task-tap_nirs.snirf'), channels=8, events=4, samples=200)
+    assert dataset_to_bids(str(raw), output, workers=1) == [changed]
+
+
+def test_rerun_keeps_the_tables_of_skipped_files(raw, tmp_path):
+    output = str(tmp_path / 'bids')
+    dataset_to_bids(str(raw), output, workers=1)
+    make_snirf(str(raw / 'sub-01_task-tap_nirs.snirf'), channels=8, events=4, samples=200)
+    dataset_to_bids(str(raw), output, workers=1)
+
+    with open(os.path.join(output, 'participants.tsv')) as file:
+        participants = [line.split('\t')[0] for line in file.read().splitlines()[1:]]
+    assert participants == ['sub-01', 'sub-02']
+    with open(os.path.join(output, 'sub-02', 'ses-1', 'sub-02_ses-1_scans.tsv')) as file:
+        assert 'nirs/sub-02_ses-1_task-tap_run-1_nirs.snirf' in file.read()
@@ -0,0 +1,37 @@
+import os
+
+from snirf2bids import BIDSIndex, dataset_to_bids, subjects_from_snirf
+
+
+def test_save_load_query_round_trip(raw, tmp_path):
+    index = BIDSIndex()
+    for name in sorted(os.listdir(raw)):
+        for subj in subjects_from_snirf(str(raw / name)):
+            index.add(subj)
+    fpath = str(tmp_path / 'index.npz')
+    index.save(fpath)
+
+    loaded = BIDSIndex.load(fpath)
+    assert len(loaded) == len(index) == 2
+    assert [loaded.row(i) for i in range(len(loaded))] == [index.row(i) for i in range(len(index))]
+
+    rows = loaded.query(sub='02', ses='1')
+    assert len(rows) == 1
+    assert rows[0]['run'] == '1'
+    assert rows[0]['filename'] == 'nirs/sub-02_ses-1_task-tap_run-1_nirs.snirf'
+    assert rows[0]['SamplingFrequency'] == 10.0
+    assert 'ses' not in loaded.query(sub='01')[0]
+    assert len(loaded.query(sub=['01', '02'], task='tap')) == 2
+    assert loaded.query(sub='03') == []
+    assert loaded.query(nonexistent='x') == []
+
+
+def test_dataset_index(raw, tmp_path):
+    output = str(tmp_path / 'bids')
+    dataset_to_bids(str(raw), output, workers=1)
+
+    index = BIDSIndex.load(os.path.join(output, '.snirf2bids_index.npz'))
+    assert sorted(index.column('sub')) == ['01', '02']
+    for row in index.query():
+        for key in ('coordsystem', 'optodes', 'channel', 'sidecar', 'events'):
+            assert os.path.isfile(os.path.join(output, row[key])), row[key]
@@ -0,0 +1,62 @@
+import json
+
+from snirf2bids import Validator, dataset_to_bids, snirf_to_bids, subjects_from_snirf, validate_bids
+
+# REQUIRED fields that a SNIRF file does not hold, so the converter cannot fill them
+_NOT_IN_SNIRF = {('Coordsystem', 'NIRSCoordinateSystem'), ('Channels', 'units'), ('Sidecar', 'TaskName')}
+
+
+def test_converter_output_only_misses_fields_absent_from_snirf(raw, tmp_path):
+    output = str(tmp_path / 'bids')
+    dataset_to_bids(str(raw), output, workers=1)
+
+    report = validate_bids(output, workers=1, level='REQUIRED')
+    assert report.runs == 2
+    assert report.errors == []
+    # no missing file, count mismatch or missing participant: only missing fields
+    assert all('message' not in finding for finding in report.findings)
+    assert {(finding['class'], finding['field']) for finding in report.findings} <= _NOT_IN_SNIRF
+
+
+def test_converter_output_passes_once_completed(raw, tmp_path):
+    output = tmp_path / 'bids'
+    dataset_to_bids(str(raw), str(output), workers=1)
+    for fpath in output.glob('sub-*/**/*_coordsystem.json'):
+        _update_json(fpath, NIRSCoordinateSystem='Other')
+    for fpath in output.glob('sub-*/**/*_nirs.json'):
+        _update_json(fpath, TaskName='tap')
+    for fpath in output.glob('sub-*/**/*_channels.tsv'):
+        lines = fpath.read_text().splitlines()
+        fpath.write_text('\n'.join([lines[0] + '\tunits'] + [line + '\tV' for line in lines[1:]]) + '\n')
+
+    report = validate_bids(str(output), workers=1, level='REQUIRED')
+    assert report.passed, report.findings
+    assert report.counts()['REQUIRED'] == 0
+
+
+def test_compliancy_paths_follow_the_flat_layout(raw, tmp_path, recwarn):
+    output = tmp_path / 'flat'
+    snirf_to_bids(str(raw / 'sub-01_task-tap_nirs.snirf'), str(output))
+    messages = [str(warning.message) for warning in recwarn if 'FATAL' in str(warning.message)]
+    assert messages
+    for message in messages:
+        fname = message.rsplit('(', 1)[1].rstrip(')')
+        assert (output / fname).is_file(), message
+
+
+def test_validator_levels(raw):
+    subj = subjects_from_snirf(str(raw / 'sub-01_task-tap_nirs.snirf'))[0]
+    required = Validator('REQUIRED').check(subj)
+    recommended = Validator('RECOMMENDED').check(subj)
+    assert {finding['level'] for finding in required} == {'REQUIRED'}
+    assert len(recommended) > len(required)
+    assert all(finding['file'].startswith('sub-01/') or finding['file'] == 'participants.tsv'
+               for finding in recommended)
+
+
+def _update_json(fpath, **fields):
+    with open(fpath) as file:
+        content = json.load(file)
+    content.update(fields)
+    with open(fpath, 'w') as file:
+        json.dump(content, file)